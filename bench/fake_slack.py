@@ -0,0 +1,281 @@
+'''
+Local stand-in for the subset of the Slack Web API slack-dashboard uses:
+users.conversations, conversations.history, conversations.replies, conversations.info,
+users.info, users.list, bots.info and usergroups.list.
+
+    python bench/fake_slack.py --messages 50000 --users 5000 --port 8765
+    SLACK_API_URL=http://127.0.0.1:8765/api/ SLACK_TOKEN=xoxb-bench SLACK_CHANNEL=C0000 slack-dashboard
+'''
+import json
+import time
+import random
+import bisect
+import argparse
+import threading
+import collections
+import typing as ty
+from urllib.parse import parse_qsl, urlsplit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+SPAN = 7 * 24 * 60 * 60.
+
+
+class Workload:
+    '''
+    Synthetic workspace: channels with messages spread over the last week,
+    users (some of them bots), user groups and the injected latency / rate limiting.
+    Every 10th message mentions a user, a channel, a user group and a link.
+    '''
+    def __init__(self, n_messages=50000, n_users=5000, n_channels=1, n_bots=20,
+                 latency=0., rate_limit_every=0, retry_after=1, seed=0):
+        rnd = random.Random(seed)
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.n_requests = 0
+        self.calls: ty.Dict[str, int] = collections.Counter()
+        self.n_rate_limited = 0
+        # conversations.history calls starting a poll: no cursor (later page) and no latest (rescan)
+        self.n_polls = 0
+        self.history_done: ty.Dict[str, float] = {}
+
+        self.users = [{
+            'id': 'U%05d' % i,
+            'name': 'user%d' % i,
+            'profile': {'real_name': 'User %d' % i},
+        } for i in range(n_users)]
+        self.bots = {}
+        for i in range(n_bots):
+            bot_id = 'B%05d' % i
+            self.bots[bot_id] = {'id': bot_id, 'name': 'bot%d' % i}
+            self.users.append({
+                'id': 'UB%04d' % i,
+                'name': 'bot%d' % i,
+                'is_bot': True,
+                'profile': {'real_name': 'Bot %d' % i, 'bot_id': bot_id},
+            })
+
+        self.users_by_id = {u['id']: u for u in self.users}
+
+        self.usergroups = [{'id': 'S%04d' % i, 'handle': 'team%d' % i, 'name': 'Team %d' % i} for i in range(5)]
+
+        self.channels = [{'id': 'C%04d' % i, 'name': 'bench%d' % i} for i in range(n_channels)]
+        self.messages: ty.Dict[str, ty.List[dict]] = {c['id']: [] for c in self.channels}
+        self.ts: ty.Dict[str, ty.List[float]] = {c['id']: [] for c in self.channels}
+        self.replies: ty.Dict[ty.Tuple[str, str], ty.List[dict]] = collections.defaultdict(list)
+        now = time.time()
+        for i in range(n_messages):
+            ch = self.channels[i % n_channels]['id']
+            t = now - SPAN + SPAN * (i + 1) / (n_messages + 1)
+            m = {'type': 'message', 'ts': '%.6f' % t, 'text': 'bench message %d &amp; more' % i}
+            if i % 10 == 0:
+                m['text'] += ' <@U%05d> <#%s|> <!subteam^%s> <https://example.com/%d|link>' % (
+                    rnd.randrange(n_users), ch, rnd.choice(self.usergroups)['id'], i)
+            if n_bots > 0 and rnd.random() < 0.2:
+                m['bot_id'] = 'B%05d' % rnd.randrange(n_bots)
+            else:
+                m['user'] = 'U%05d' % rnd.randrange(n_users)
+            self.messages[ch].append(m)
+            # as rounded in the message, so that oldest/latest compare like Slack's
+            self.ts[ch].append(float(m['ts']))
+
+    def post(self, ch, text):
+        t = time.time()
+        with self.lock:
+            m = {'type': 'message', 'ts': '%.6f' % t, 'text': text, 'user': self.users[0]['id']}
+            self.messages[ch].append(m)
+            self.ts[ch].append(float(m['ts']))
+
+    def edit(self, ch, i, text):
+        '''
+        Edits the i-th message of ch (negative: from the newest).
+        '''
+        with self.lock:
+            m = self.messages[ch][i]
+            m['text'] = text
+            m['edited'] = {'user': self.users[0]['id'], 'ts': '%.6f' % time.time()}
+
+    def reply(self, ch, i, text):
+        '''
+        Replies to the i-th message of ch (negative: from the newest).
+        '''
+        with self.lock:
+            parent = self.messages[ch][i]
+            ts = '%.6f' % time.time()
+            self.replies[(ch, parent['ts'])].append(
+                {'type': 'message', 'ts': ts, 'thread_ts': parent['ts'], 'text': text, 'user': self.users[1]['id']})
+            parent['thread_ts'] = parent['ts']
+            parent['reply_count'] = parent.get('reply_count', 0) + 1
+            parent['latest_reply'] = ts
+
+    def delete(self, ch, i):
+        with self.lock:
+            del self.messages[ch][i]
+            del self.ts[ch][i]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'requests': self.n_requests,
+                'calls': dict(self.calls),
+                'rate_limited': self.n_rate_limited,
+                'polls': self.n_polls,
+                'history_done': dict(self.history_done),
+            }
+
+    def handle(self, method, args) -> ty.Tuple[int, dict]:
+        with self.lock:
+            self.n_requests += 1
+            self.calls[method] += 1
+            limited = self.rate_limit_every > 0 and self.n_requests % self.rate_limit_every == 0
+            if limited:
+                self.n_rate_limited += 1
+        if self.latency > 0.:
+            time.sleep(self.latency)
+        if limited:
+            return 429, {'ok': False, 'error': 'ratelimited'}
+
+        f = getattr(self, method.replace('.', '_'), None)
+        if f is None:
+            return 200, {'ok': False, 'error': 'unknown_method'}
+        return 200, f(args)
+
+    @staticmethod
+    def paginate(items, args, default_limit=100):
+        limit = int(args.get('limit') or default_limit)
+        start = int(args.get('cursor') or 0)
+        page = items[start:start + limit]
+        next_cursor = str(start + limit) if start + limit < len(items) else ''
+        return page, {'next_cursor': next_cursor}
+
+    def users_conversations(self, args):
+        page, meta = self.paginate(self.channels, args)
+        return {'ok': True, 'channels': page, 'response_metadata': meta}
+
+    def conversations_history(self, args):
+        ch = args.get('channel')
+        if ch not in self.messages:
+            return {'ok': False, 'error': 'channel_not_found'}
+        oldest = float(args.get('oldest') or 0.)
+        latest = float(args.get('latest') or time.time() + 1.)
+        with self.lock:
+            if not args.get('cursor') and not args.get('latest'):
+                self.n_polls += 1
+            ts = self.ts[ch]
+            if args.get('inclusive') in ('1', 'true'):
+                ms = self.messages[ch][bisect.bisect_left(ts, oldest):bisect.bisect_right(ts, latest)]
+            else:
+                ms = self.messages[ch][bisect.bisect_right(ts, oldest):bisect.bisect_left(ts, latest)]
+        ms = ms[::-1]  # newest first, like Slack
+        page, meta = self.paginate(ms, args)
+        if not meta['next_cursor']:
+            with self.lock:
+                self.history_done.setdefault(ch, time.time())
+        return {'ok': True, 'messages': page, 'has_more': bool(meta['next_cursor']), 'response_metadata': meta}
+
+    def conversations_replies(self, args):
+        ch = args.get('channel')
+        with self.lock:
+            parents = [m for m in self.messages.get(ch, []) if m['ts'] == args.get('ts')]
+            ms = parents + list(self.replies.get((ch, args.get('ts')), []))
+        if not parents:
+            return {'ok': False, 'error': 'thread_not_found'}
+        page, meta = self.paginate(ms, args)
+        return {'ok': True, 'messages': page, 'has_more': bool(meta['next_cursor']), 'response_metadata': meta}
+
+    def conversations_info(self, args):
+        for c in self.channels:
+            if c['id'] == args.get('channel'):
+                return {'ok': True, 'channel': c}
+        return {'ok': False, 'error': 'channel_not_found'}
+
+    def users_info(self, args):
+        u = self.users_by_id.get(args.get('user'))
+        if u is None:
+            return {'ok': False, 'error': 'user_not_found'}
+        return {'ok': True, 'user': u}
+
+    def users_list(self, args):
+        page, meta = self.paginate(self.users, args)
+        return {'ok': True, 'members': page, 'response_metadata': meta}
+
+    def bots_info(self, args):
+        bot = self.bots.get(args.get('bot'))
+        if bot is None:
+            return {'ok': False, 'error': 'bot_not_found'}
+        return {'ok': True, 'bot': bot}
+
+    def usergroups_list(self, args):
+        return {'ok': True, 'usergroups': self.usergroups}
+
+
+def make_server(workload: Workload, host='127.0.0.1', port=0) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self.reply(200, workload.stats())
+            else:
+                self.do_POST()
+
+        def do_POST(self):
+            u = urlsplit(self.path)
+            args = dict(parse_qsl(u.query))
+            n = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(n).decode('utf-8') if n else ''
+            if body.startswith('{'):
+                args.update(json.loads(body))
+            else:
+                args.update(parse_qsl(body))
+            status, d = workload.handle(u.path.rsplit('/', 1)[-1], args)
+            self.reply(status, d)
+
+        def reply(self, status, d):
+            b = json.dumps(d).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(b)))
+            if status == 429:
+                self.send_header('Retry-After', str(workload.retry_after))
+            self.end_headers()
+            self.wfile.write(b)
+
+        def log_message(self, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def add_workload_args(parser: argparse.ArgumentParser):
+    parser.add_argument('--messages', type=int, default=50000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--channels', type=int, default=1)
+    parser.add_argument('--bots', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0., help='seconds added to every response')
+    parser.add_argument('--rate-limit-every', type=int, default=0, help='answer every Nth request with 429')
+    parser.add_argument('--retry-after', type=int, default=1)
+
+
+def workload_from_args(args) -> Workload:
+    return Workload(
+        n_messages=args.messages, n_users=args.users, n_channels=args.channels, n_bots=args.bots,
+        latency=args.latency, rate_limit_every=args.rate_limit_every, retry_after=args.retry_after)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_workload_args(parser)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    srv = make_server(workload_from_args(args), port=args.port)
+    print('Serving on http://127.0.0.1:%d/api/' % srv.server_port)
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+'''
+Runs slack-dashboard against bench/fake_slack.py in a pseudo terminal and reports
+
+- time to first paint (first message text on screen)
+- wall time of the 7-day backfill (last history page served for every channel)
+- API calls per poll in the steady state (a poll: one channel's history fetch, rescans not counted)
+- peak RSS of the dashboard process
+
+A cold run starts with empty configuration/data directories, a warm run reuses them
+(profile cache and message store). Example:
+
+    python bench/run_bench.py --messages 50000 --users 5000 --steady 30
+    python bench/run_bench.py --latency 0.05 --rate-limit-every 50 --json
+'''
+import os
+import sys
+import pty
+import json
+import time
+import select
+import signal
+import argparse
+import tempfile
+import threading
+
+from fake_slack import make_server, add_workload_args, workload_from_args
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRST_PAINT_MARKER = b'bench message'
+
+
+def run_once(workload, api_url, home, args):
+    env = dict(os.environ)
+    env.update({
+        'SLACK_API_URL': api_url,
+        'SLACK_TOKEN': 'xoxb-bench',
+        'SLACK_CHANNEL': ','.join(c['id'] for c in workload.channels),
+        'XDG_CONFIG_HOME': os.path.join(home, 'config'),
+        'XDG_DATA_HOME': os.path.join(home, 'data'),
+        'TERM': 'xterm',
+        'LINES': str(args.lines),
+        'COLUMNS': str(args.cols),
+        'PYTHONPATH': REPO_DIR + os.pathsep + env.get('PYTHONPATH', ''),
+    })
+    if args.use_async:
+        env['SLACK_ASYNC'] = '1'
+
+    before = workload.stats()
+    with workload.lock:
+        workload.history_done = {}
+    t0 = time.monotonic()
+    t0_wall = time.time()
+    pid, fd = pty.fork()
+    if pid == 0:
+        os.execvpe(sys.executable, [sys.executable, '-m', 'slack_dashboard.main'], env)
+
+    first_paint = None
+    output = bytearray()
+    backfill = None
+    steady_start = None
+    steady_stats = None
+
+    def read_available(timeout):
+        r, _, _ = select.select([fd], [], [], timeout)
+        if r:
+            try:
+                output.extend(os.read(fd, 65536))
+            except OSError:
+                return False
+        return True
+
+    deadline = t0 + args.timeout
+    while time.monotonic() < deadline:
+        if not read_available(0.05):
+            break
+        now = time.monotonic()
+        if first_paint is None and FIRST_PAINT_MARKER in output:
+            first_paint = now - t0
+        done = workload.stats()['history_done']
+        if backfill is None and len(done) == len(workload.channels):
+            backfill = max(done.values()) - t0_wall
+            steady_start = now
+            steady_stats = workload.stats()
+        if steady_start is not None and now - steady_start >= args.steady:
+            break
+
+    steady_end_stats = workload.stats()
+    os.write(fd, b'\x03')  # Ctrl-C
+    t_kill = time.monotonic() + 5.
+    while time.monotonic() < t_kill:
+        wpid, status, rusage = os.wait4(pid, os.WNOHANG)
+        if wpid != 0:
+            break
+        read_available(0.05)
+    else:
+        os.kill(pid, signal.SIGKILL)
+        wpid, status, rusage = os.wait4(pid, 0)
+    os.close(fd)
+
+    calls = diff_calls(before['calls'], steady_end_stats['calls'])
+    result = {
+        'first_paint_s': first_paint,
+        'backfill_s': backfill,
+        'peak_rss_kb': rusage.ru_maxrss,
+        'api_calls': calls,
+        'rate_limited': steady_end_stats['rate_limited'] - before['rate_limited'],
+    }
+    if steady_stats is not None:
+        steady_calls = diff_calls(steady_stats['calls'], steady_end_stats['calls'])
+        n_polls = steady_end_stats['polls'] - steady_stats['polls']
+        result['steady_s'] = args.steady
+        result['steady_api_calls'] = steady_calls
+        result['api_calls_per_poll'] = sum(steady_calls.values()) / n_polls if n_polls else None
+    return result
+
+
+def diff_calls(before, after):
+    return {k: v - before.get(k, 0) for k, v in after.items() if v - before.get(k, 0) > 0}
+
+
+def print_result(name, r):
+    def f(v, fmt):
+        return 'n/a' if v is None else fmt % v
+    print('%s:' % name)
+    print('  time to first paint   %s' % f(r['first_paint_s'], '%.3f s'))
+    print('  7-day backfill        %s' % f(r['backfill_s'], '%.3f s'))
+    print('  API calls per poll    %s' % f(r.get('api_calls_per_poll'), '%.2f'))
+    print('  peak RSS              %d KiB' % r['peak_rss_kb'])
+    print('  API calls             %s' % ', '.join('%s=%d' % kv for kv in sorted(r['api_calls'].items())))
+    print('  429 injected          %d' % r['rate_limited'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_workload_args(parser)
+    parser.add_argument('--steady', type=float, default=30., help='seconds to watch the steady state')
+    parser.add_argument('--timeout', type=float, default=600.)
+    parser.add_argument('--lines', type=int, default=50)
+    parser.add_argument('--cols', type=int, default=160)
+    parser.add_argument('--async', dest='use_async', action='store_true', help='benchmark SLACK_ASYNC=1')
+    parser.add_argument('--no-warm', action='store_true', help='skip the warm start run')
+    parser.add_argument('--json', action='store_true', help='print JSON instead of text')
+    args = parser.parse_args()
+
+    workload = workload_from_args(args)
+    srv = make_server(workload)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    api_url = 'http://127.0.0.1:%d/api/' % srv.server_port
+
+    results = {}
+    with tempfile.TemporaryDirectory() as home:
+        results['cold'] = run_once(workload, api_url, home, args)
+        if not args.no_warm:
+            results['warm'] = run_once(workload, api_url, home, args)
+    srv.shutdown()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, r in results.items():
+            print_result(name, r)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+# Makes the repository root importable, so that a plain `pytest` finds slack_dashboard.
@@ -8,6 +8,9 @@ setup(
         "slack-sdk==3.23.0",
         "appdirs==1.4.4",
     ],
+    extras_require={
+        "async": ["aiohttp"],
+    },
     packages=['slack_dashboard'],
     entry_points={
         'console_scripts': [
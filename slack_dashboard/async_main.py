@@ -0,0 +1,231 @@
+'''
+asyncio engine, enabled by SLACK_ASYNC=1. Needs aiohttp (pip install slack-dashboard[async]).
+'''
+import json
+import time
+import asyncio
+import curses
+import heapq
+import typing as ty
+from urllib.error import URLError
+
+import aiohttp
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.async_client import AsyncWebClient
+
+import slack_dashboard.token_util as token_util
+import slack_dashboard.channel_util as channel_util
+from slack_dashboard.client_util import API_URL, call_failed
+from slack_dashboard.main import (
+    Session, HISTORY_PAGE_SIZE, CHANNELS_PAGE_SIZE, NETWORK_ERRORS, msg_ts, next_cursor, history_args)
+from slack_dashboard.poll_util import Scheduler
+from slack_dashboard.metrics_util import metrics
+from slack_dashboard.profile_util import AsyncProfileCache
+from slack_dashboard.transport_util import POOL_SIZE, IDLE_TIMEOUT
+
+INPUT_INTERVAL = 0.05
+ASYNC_NETWORK_ERRORS = NETWORK_ERRORS + (aiohttp.ClientError, asyncio.TimeoutError)
+
+
+def response_bytes(r) -> int:
+    # aiohttp has already parsed the body; Content-Length when given, else its JSON size
+    n = (r.headers or {}).get('Content-Length') or (r.headers or {}).get('content-length')
+    try:
+        return int(n)
+    except (TypeError, ValueError):
+        return len(json.dumps(r.data))
+
+
+class AsyncScheduledWebClient(AsyncWebClient):
+    '''
+    AsyncWebClient counterpart of client_util.ScheduledWebClient.
+    '''
+    def __init__(self, token, scheduler: Scheduler, **kwargs):
+        kwargs.setdefault('base_url', API_URL)
+        super().__init__(token, **kwargs)
+        self.scheduler = scheduler
+
+    async def api_call(self, api_method, **kwargs):
+        while True:
+            await asyncio.sleep(self.scheduler.delay_for(api_method))
+            self.scheduler.note_call(api_method)
+            t = time.monotonic()
+            try:
+                r = await super().api_call(api_method, **kwargs)
+            except Exception as e:
+                if call_failed(self.scheduler, api_method, t, e):
+                    continue
+                raise
+            metrics.observe_call(api_method, time.monotonic() - t, r.status_code)
+            metrics.observe_bytes(response_bytes(r))
+            return r
+
+
+class AsyncSession(Session):
+    '''
+    History polling and keyboard/resize handling run as separate tasks on one event loop,
+    so a slow Slack response never blocks input.
+    '''
+    def connect(self):
+        try:
+            asyncio.run(self.connect_async())
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # main_impl retries network errors
+            raise URLError(e)
+
+    async def connect_async(self):
+        # one aiohttp session keeps connections alive across calls
+        http = None
+        if POOL_SIZE > 0:
+            http = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=POOL_SIZE, keepalive_timeout=IDLE_TIMEOUT))
+        try:
+            await self.run_async(http)
+        finally:
+            if http is not None:
+                await http.close()
+
+    async def run_async(self, http: ty.Optional[aiohttp.ClientSession]):
+        must_save_token = False
+        token = token_util.load()
+        if not token:
+            token = token_util.ask(self.webhook_win, self.status_win, self.prompt_win)
+            must_save_token = True
+
+        self.profiles = AsyncProfileCache(None)
+        painted = self.render_cached()
+        self.sc = self.profiles.sc = AsyncScheduledWebClient(token, self.scheduler, session=http)
+        await self.profiles.warm()
+        if not painted:
+            await self.init_ch_async()
+            self.start_panes()
+            ms = self.stored_messages()
+            await self.profiles.prefetch(self.formatter.page_keys(self.with_replies(ms)))
+            self.show_page(ms)
+            self.refresh_panes()
+
+        tasks = [
+            asyncio.ensure_future(self.poll_loop(token, must_save_token)),
+            asyncio.ensure_future(self.input_loop()),
+        ]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for t in done:
+                t.result()
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    async def init_ch_async(self):
+        chs = channel_util.load()
+        if chs:
+            self.set_channels(chs, await asyncio.gather(*[self.profiles.resolve('channel', ch) for ch in chs]))
+        else:
+            self.ask_ch(await self.list_channels_async())
+
+    async def list_channels_async(self) -> ty.List[dict]:
+        cs = []
+        cursor = None
+        while True:
+            r = await self.sc.users_conversations(limit=CHANNELS_PAGE_SIZE, cursor=cursor)
+            cs.extend(r.get('channels', []))
+            cursor = next_cursor(r)
+            if not cursor:
+                return cs
+
+    async def poll_loop(self, token, must_save_token):
+        while True:
+            self.rollover()
+            try:
+                await self.profiles.warm()
+                await self.poll_async()
+            except ASYNC_NETWORK_ERRORS:
+                self.scheduler.on_network_error()
+            self.show_status()
+            self.refresh_panes()
+            self.profiles.save()
+            metrics.maybe_dump()
+
+            # now all OAuth scope verified
+            if must_save_token and self.last_connected is not None:
+                token_util.save_default(token)
+                must_save_token = False
+
+            await asyncio.sleep(self.scheduler.next_delay())
+
+    async def poll_async(self):
+        '''
+        Fetches the first page of every due channel concurrently and shows them as one merged timeline,
+        then the remaining (older) pages.
+        '''
+        due = self.scheduler.due_keys(self.chs)
+        streams = [self.get_messages_async(ch) for ch in due]
+        firsts = await asyncio.gather(*[self.first_page(g) for g in streams])
+        await self.profiles.prefetch(self.formatter.page_keys([m for page in firsts for m in page]))
+        self.show_page(list(heapq.merge(*firsts, key=msg_ts)))
+        for ch, page in zip(due, firsts):
+            self.scheduler.on_poll(len(page), ch)
+        await asyncio.gather(*[self.rescan_async(ch) for ch in due if self.index.due(ch)])
+        self.refresh_panes()
+
+        for g in streams:
+            async for page in g:
+                await self.profiles.prefetch(self.formatter.page_keys(page))
+                self.show_page(page)
+                self.refresh_panes()
+        await self.fetch_threads_async()
+
+    async def rescan_async(self, ch):
+        oldest, latest = time.time() - self.index.window, self.last_ts[ch]
+        r = await self.sc.conversations_history(
+            channel=ch, oldest=str(oldest), latest=str(latest), inclusive=True, limit=HISTORY_PAGE_SIZE)
+        changed, deleted = self.diff_window(ch, r, oldest, latest)
+        await self.profiles.prefetch(self.formatter.page_keys(changed))
+        self.patch(ch, changed, deleted)
+
+    async def fetch_threads_async(self):
+        parents = self.threads.take() if self.threads is not None else []
+        if len(parents) == 0:
+            return
+        rs = await asyncio.gather(*[self.fetch_thread_async(m) for m in parents])
+        parents, replies = self.put_threads(parents, rs)
+        await self.profiles.prefetch(self.formatter.page_keys(replies))
+        self.show_page(sorted(parents, key=msg_ts))
+        self.refresh_panes()
+
+    async def fetch_thread_async(self, m):
+        try:
+            return await self.sc.conversations_replies(channel=m['channel'], ts=m['ts'], limit=HISTORY_PAGE_SIZE)
+        except SlackApiError as e:
+            self.drop_thread(m, e)
+            return None
+
+    @staticmethod
+    async def first_page(g):
+        async for page in g:
+            return page
+        return []
+
+    async def get_messages_async(self, ch):
+        # see Session.get_messages
+        last_ts = newest = self.last_ts[ch]
+        cursor = None
+        while True:
+            ms = await self.sc.conversations_history(**history_args(ch, last_ts, cursor))
+            page, cursor, newest = self.history_page(ch, ms, last_ts, newest)
+            if len(page) > 0:
+                yield page
+
+            if not cursor:
+                break
+
+    async def input_loop(self):
+        while True:
+            await asyncio.sleep(INPUT_INTERVAL)
+            k = self.prompt_win.getch()
+            if k == curses.KEY_RESIZE:
+                await asyncio.sleep(1)  # wait tranquilizing
+                while self.prompt_win.getch() != -1:  # ignore other curses.KEY_RESIZE
+                    pass
+                self.relayout()
+            else:
+                self.handle_key(k)
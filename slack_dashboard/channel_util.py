@@ -10,17 +10,22 @@ CHANNEL_PATH = os.path.join(appdirs.user_config_dir(APP_NAME), "slack_channel")
 
 
 def load():
+    '''
+    Returns the list of channel IDs to listen, or None.
+    Several channels are separated by commas or newlines.
+    '''
     # Read from environment variable
-    ch = os.environ.get('SLACK_CHANNEL')
-    if ch:
-        return ch
-
-    # Read from local config file
-    try:
-        with open(CHANNEL_PATH) as slack_ch_file:
-            return slack_ch_file.read().strip()
-    except IOError:
-        return None
+    chs = os.environ.get('SLACK_CHANNEL')
+    if not chs:
+        # Read from local config file
+        try:
+            with open(CHANNEL_PATH) as slack_ch_file:
+                chs = slack_ch_file.read()
+        except IOError:
+            return None
+
+    chs = [ch.strip() for ch in chs.replace('\n', ',').split(',')]
+    return [ch for ch in chs if ch] or None
 
 
 def ask_name(webhook_win, status_win, prompt_win, available_ch_names):
@@ -0,0 +1,70 @@
+import os
+import time
+import http.client
+import typing as ty
+from urllib.error import URLError
+
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+
+from slack_dashboard.metrics_util import metrics
+from slack_dashboard.poll_util import Scheduler, retry_after
+from slack_dashboard.transport_util import ConnectionPool, POOL_SIZE
+
+# another API server, e.g. bench/fake_slack.py
+API_URL = os.environ.get('SLACK_API_URL') or WebClient.BASE_URL
+
+
+class ScheduledWebClient(WebClient):
+    '''
+    WebClient which waits for the Scheduler before each call and retries after Retry-After on 429.
+    HTTP goes through transport (a keep-alive ConnectionPool by default, plain urllib when
+    SLACK_POOL_SIZE=0 or a proxy is configured).
+    '''
+    def __init__(self, token, scheduler: Scheduler, transport: ty.Optional[ConnectionPool] = None, **kwargs):
+        kwargs.setdefault('base_url', API_URL)
+        super().__init__(token, **kwargs)
+        self.scheduler = scheduler
+        if transport is None and POOL_SIZE > 0:
+            transport = ConnectionPool(ssl_context=self.ssl)
+        self.transport = transport
+
+    def api_call(self, api_method, **kwargs):
+        while True:
+            time.sleep(self.scheduler.delay_for(api_method))
+            self.scheduler.note_call(api_method)
+            t = time.monotonic()
+            try:
+                r = super().api_call(api_method, **kwargs)
+            except Exception as e:
+                if call_failed(self.scheduler, api_method, t, e):
+                    continue
+                raise
+            metrics.observe_call(api_method, time.monotonic() - t, r.status_code)
+            return r
+
+    def _perform_urllib_http_request_internal(self, url, req):
+        if self.transport is None or self.proxy:
+            resp = super()._perform_urllib_http_request_internal(url, req)
+        else:
+            try:
+                resp = self.transport.request(req, self.timeout)
+            except (OSError, http.client.HTTPException) as e:
+                # same as urllib, so callers see one kind of network error
+                raise URLError(e)
+        body = resp['body']
+        metrics.observe_bytes(len(body.encode('utf-8') if isinstance(body, str) else body))
+        return resp
+
+
+def call_failed(scheduler: Scheduler, api_method, t, e: Exception) -> bool:
+    '''
+    Records a call started at t (time.monotonic()) which raised e.
+    Returns True when it is to be made again, after the Retry-After of a 429.
+    '''
+    status = e.response.status_code if isinstance(e, SlackApiError) else None
+    metrics.observe_call(api_method, time.monotonic() - t, status)
+    if status != 429:
+        return False
+    scheduler.on_rate_limited(api_method, retry_after(e.response))
+    return True
@@ -0,0 +1,21 @@
+import os
+
+
+def env_int(name, default):
+    v = os.environ.get(name)
+    try:
+        return int(v) if v else default
+    except ValueError:
+        return default
+
+
+def env_float(name, default):
+    v = os.environ.get(name)
+    try:
+        return float(v) if v else default
+    except ValueError:
+        return default
+
+
+def env_flag(name):
+    return os.environ.get(name, '').lower() in ('1', 'true', 'yes', 'on')
@@ -1,129 +1,415 @@
 import typing as ty
+import heapq
 from datetime import datetime, timedelta
 import time
 import curses
-import html
 from urllib.error import URLError
-from slack_sdk import WebClient
-from slack_sdk.errors import SlackApiError
+from slack_dashboard.poll_util import Scheduler
+from slack_dashboard.metrics_util import metrics
 import slack_dashboard.token_util as token_util
 import slack_dashboard.channel_util as channel_util
+from slack_dashboard.profile_util import ProfileCache, profile_key, UNKNOWN_USER
+from slack_dashboard.mrkdwn_util import Formatter
+from slack_dashboard.thread_util import ThreadCache, THREADS
+from slack_dashboard.store_util import MessageStore, MessageIndex
+from slack_dashboard.config_util import env_int, env_flag
+from slack_dashboard.render_util import MessageRecord, Pane, SCROLLBACK
 
-MAX_ERROR = 3
-ERROR_SPAN_TH = timedelta(seconds=30.)
-INIT_SPAN = timedelta(days=7)
-
+if ty.TYPE_CHECKING:
+    from slack_sdk import WebClient
 
-class WindowResizeException(Exception):
-    pass
+INIT_SPAN = timedelta(days=7)
+HISTORY_PAGE_SIZE = env_int('SLACK_HISTORY_PAGE_SIZE', 999)
+CHANNELS_PAGE_SIZE = 999
+INPUT_INTERVAL = 0.1
+NETWORK_ERRORS = (URLError, TimeoutError, ConnectionError)
 
 
 def main():
-    while True:
-        try:
-            print(curses.wrapper(main_impl))
-            break
-        except WindowResizeException:
-            pass
+    session_class = Session
+    if env_flag('SLACK_ASYNC'):
+        from slack_dashboard.async_main import AsyncSession
+        session_class = AsyncSession
+    print(curses.wrapper(main_impl, session_class))
 
 
-def main_impl(stdscr):
-    n_error = 0
-    last_error = None
+def main_impl(stdscr, session_class=None):
+    session_class = session_class or Session
+    scheduler = Scheduler()
     exit_msg = ''
     while True:
         try:
-            s = Session(stdscr)
+            # a running Session backs off by itself; this is for errors while starting up
+            s = session_class(stdscr, scheduler)
             s.connect()
-        except URLError:
-            t = datetime.now()
-            if last_error is not None:
-                if t - last_error < ERROR_SPAN_TH:
-                    n_error += 1
-                    if n_error > MAX_ERROR:
-                        exit_msg = 'Network connection is unstable or lost.'
-                        break
-                else:
-                    n_error = 0
-            last_error = t
-            time.sleep(10.)
-        except SlackApiError as e:
-            exit_msg = str(e)
-            break
+        except NETWORK_ERRORS:
+            time.sleep(scheduler.on_network_error())
         except KeyboardInterrupt:
             exit_msg = 'slack-dashboard exit by Ctrl+C.'
             break
+        except Exception as e:
+            # slack_sdk is imported late, see Session.connect
+            from slack_sdk.errors import SlackApiError
+            if not isinstance(e, SlackApiError):
+                raise
+            exit_msg = str(e)
+            break
 
     return exit_msg
 
 
 class Session:
-    def __init__(self, stdscr):
-        self.last_t: ty.Optional[datetime] = None
-        self.bot_profile_cache = {}
-        self.sc: ty.Optional[WebClient] = None
-        self.ch = None
-        self.ch_name = None
-        self.has_dateless_msg = False
-        self.last_cn = ''
-        self.last_un = ''
+    def __init__(self, stdscr, scheduler: ty.Optional[Scheduler] = None):
+        self.scheduler = scheduler or Scheduler()
+        self.last_ts: ty.Dict[str, float] = {}
+        self.sc: ty.Optional['WebClient'] = None
+        self.profiles: ty.Optional[ProfileCache] = None
+        self.formatter: ty.Optional[Formatter] = None
+        self.store = MessageStore()
+        self.index = MessageIndex()
+        self.threads = ThreadCache() if THREADS else None
+        self.chs: ty.List[str] = []
+        self.ch_names: ty.Dict[str, str] = {}
+        self.panes = [Pane()]
+        self.last_connected: ty.Optional[datetime] = None
 
         curses.use_default_colors()
 
         curses.curs_set(0)
-        full_h, full_w = stdscr.getmaxyx()
+        self.stdscr = stdscr
+        self.make_windows()
+
+    def make_windows(self):
+        full_h, full_w = self.stdscr.getmaxyx()
         webhook_win = curses.newwin(full_h - 2, full_w, 0, 0)
         webhook_win.scrollok(1)
-        webhook_win.nodelay(True)
         status_win = curses.newwin(1, full_w, full_h - 2, 0)
         status_win.scrollok(1)
         status_win.refresh()
         prompt_win = curses.newwin(1, full_w, full_h - 1, 0)
         prompt_win.scrollok(1)
-        self.stdscr = stdscr
         self.webhook_win, self.status_win, self.prompt_win = webhook_win, status_win, prompt_win
 
-    def init_ch(self):
-        cs = self.sc.users_conversations()
+        pane_h = (full_h - 2) // len(self.panes)
+        for i, pane in enumerate(self.panes):
+            h = pane_h if i < len(self.panes) - 1 else full_h - 2 - pane_h * i
+            pane.place(pane_h * i, h, full_w)
+
+    def make_panes(self):
+        full_h, _ = self.stdscr.getmaxyx()
+        # a header row and at least one message row each
+        if env_flag('SLACK_TILE') and 1 < len(self.chs) <= (full_h - 2) // 2:
+            self.panes = [Pane(ch, '#' + self.ch_names[ch]) for ch in self.chs]
+        else:
+            self.panes = [Pane()]
+        self.make_windows()
+
+    def refresh_panes(self):
+        for pane in self.panes:
+            pane.noutrefresh()
+        curses.doupdate()
+
+    def relayout(self):
+        self.stdscr.clear()
+        self.stdscr.noutrefresh()
+        self.make_windows()
+        self.start_input()
+        for pane in self.panes:
+            pane.paint()
+        self.show_status()
+        self.refresh_panes()
+
+    def start_input(self):
+        # after the prompts, which need a blocking prompt_win
+        self.prompt_win.nodelay(True)
+        self.prompt_win.keypad(True)
+
+    def handle_key(self, k):
+        if k == curses.KEY_PPAGE or k == curses.KEY_NPAGE:
+            for pane in self.panes:
+                pane.scroll_page(1 if k == curses.KEY_PPAGE else -1)
+            self.refresh_panes()
+        elif k == curses.KEY_END:
+            for pane in self.panes:
+                pane.model.scroll = 0
+                pane.paint()
+            self.refresh_panes()
+        elif k == 3:  # CTRL-C
+            raise KeyboardInterrupt('Ctrl-C')
+
+    def show_status(self):
+        msg = self.scheduler.status() + ' | ' + metrics.summary()
+        if self.last_connected is not None:
+            msg = 'Last connected: ' + self.last_connected.strftime("%Y-%m-%d %H:%M:%S") + ' | ' + msg
+        self.status_win.erase()
+        self.status_win.addstr(msg[:max(self.status_win.getmaxyx()[1] - 1, 0)])
+        self.status_win.noutrefresh()
 
-        self.ch = channel_util.load()
-        if self.ch:
-            for c in cs['channels']:
-                if c['id'] == self.ch:
-                    self.ch_name = c['name']
+    def init_ch(self):
+        chs = channel_util.load()
+        if chs:
+            # known IDs: names from the cache, or one conversations.info each
+            self.set_channels(chs, [self.profiles.name('channel', ch) for ch in chs])
         else:
-            available_ch_names = [c['name'] for c in cs['channels']]
-            self.ch_name = channel_util.ask_name(self.webhook_win, self.status_win, self.prompt_win, available_ch_names)
-            for c in cs['channels']:
-                if c['name'] == self.ch_name:
-                    self.ch = c['id']
-                    channel_util.save_default(self.ch)
-                    break
-
-    def get_messages(self):
-        last_ts = self.last_t.timestamp()
-        ms = self.sc.conversations_history(
-            oldest=str(last_ts),
-            channel=self.ch)
+            self.ask_ch(self.list_channels())
+
+    def init_cached_ch(self) -> bool:
+        '''
+        Sets the configured channels if all their names are cached, without asking Slack.
+        '''
+        chs = channel_util.load()
+        names = [self.profiles.cached('channel', ch) for ch in chs or []]
+        if not chs or None in names:
+            return False
+        self.set_channels(chs, names)
+        return True
+
+    def set_channels(self, chs: ty.List[str], names: ty.List[str]):
+        self.chs = chs
+        self.ch_names = dict(zip(chs, names))
+
+    def list_channels(self) -> ty.List[dict]:
+        cs = []
+        cursor = None
+        while True:
+            r = self.sc.users_conversations(limit=CHANNELS_PAGE_SIZE, cursor=cursor)
+            cs.extend(r.get('channels', []))
+            cursor = next_cursor(r)
+            if not cursor:
+                return cs
+
+    def ask_ch(self, cs: ty.List[dict]):
+        available_ch_names = [c['name'] for c in cs]
+        ch_name = channel_util.ask_name(self.webhook_win, self.status_win, self.prompt_win, available_ch_names)
+        for c in cs:
+            if c['name'] == ch_name:
+                self.set_channels([c['id']], [ch_name])
+                self.profiles.put('channel', c['id'], ch_name)
+                channel_util.save_default(c['id'])
+                break
 
+    def start_panes(self):
+        self.formatter = Formatter(self.profiles, self.ch_names)
+        self.make_panes()
+        self.start_input()
         self.status_win.erase()
-        self.status_win.addstr('Last connected: ' + datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
         self.status_win.noutrefresh()
 
-        m_dict: dict[float, dict] = {}
+    def get_messages(self, ch) -> ty.Iterator[ty.List[dict]]:
+        '''
+        Yields messages of ch newer than self.last_ts[ch] page by page, each page in ts order.
+        Slack returns the newest page first, so later pages are older; self.last_ts[ch] moves
+        only with the last page, so a stream cut short is fetched again from where it started.
+        '''
+        last_ts = newest = self.last_ts[ch]
+        cursor = None
+        while True:
+            ms = self.sc.conversations_history(**history_args(ch, last_ts, cursor))
+            page, cursor, newest = self.history_page(ch, ms, last_ts, newest)
+            if len(page) > 0:
+                self.profiles.prefetch(self.formatter.page_keys(page))
+                yield page
 
-        if 'messages' not in ms:
-            return m_dict
-        for m in ms['messages']:
+            if not cursor:
+                break
+
+    def history_page(self, ch, ms, last_ts, newest) -> ty.Tuple[ty.List[dict], ty.Optional[str], float]:
+        '''
+        Takes one conversations.history response of a stream which started at last_ts.
+        Returns its page, the cursor of the next one and the newest ts of the stream so far,
+        which becomes self.last_ts[ch] with the last page.
+        '''
+        page = self.make_page(ch, ms, last_ts)
+        cursor = next_cursor(ms)
+        if len(page) > 0:
+            newest = max(newest, msg_ts(page[-1]))
+        if not cursor:
+            self.set_synced(ch, newest)
+        return page, cursor, newest
+
+    def make_page(self, ch, ms, last_ts) -> ty.List[dict]:
+        self.last_connected = datetime.now()
+        self.show_status()
+
+        m_dict: dict[float, dict] = {}
+        for m in ms.get('messages', []):
             if m['type'] != 'message':
                 continue
             ts = float(m['ts'])
-            if abs(ts - last_ts) < 0.01:
+            if ts <= last_ts:
                 continue
-            m['channel'] = self.ch
+            m['channel'] = ch
             m_dict[ts] = m
 
-        return m_dict
+        page = [m_dict[ts] for ts in sorted(m_dict.keys())]
+        self.store.put(page)
+        self.index.add(page)
+        return page
+
+    def set_synced(self, ch, ts: float):
+        self.last_ts[ch] = ts
+        self.store.set_synced(ch, ts)
+
+    def stored_messages(self) -> ty.List[dict]:
+        oldest = (datetime.now() - INIT_SPAN).timestamp()
+        self.store.prune(oldest)
+        self.last_ts = {}
+        for ch in self.chs:
+            ts = self.store.synced_ts(ch)
+            self.last_ts[ch] = max(ts, oldest) if ts else oldest
+        # no more than the scrollback can hold
+        ms = self.store.messages(self.chs, oldest, SCROLLBACK)
+        self.index.add(ms)
+        if self.threads is not None:
+            self.threads.load(self.store.replies(self.chs, oldest))
+        return ms
+
+    def render_stored(self):
+        ms = self.stored_messages()
+        self.profiles.prefetch(self.formatter.page_keys(self.with_replies(ms)))
+        self.show_page(ms)
+
+    def with_replies(self, ms) -> ty.List[dict]:
+        '''
+        ms and the cached replies of their threads, which are formatted with them.
+        '''
+        if self.threads is None:
+            return ms
+        return ms + [r for m in ms for r in self.threads.replies(m['channel'], m['ts'])]
+
+    def render_cached(self) -> bool:
+        '''
+        Paints the stored messages before anything is asked to Slack, when the channels
+        and every name the messages need are cached. Returns False when that's not the case.
+        '''
+        if not self.init_cached_ch():
+            return False
+        ms = self.stored_messages()
+        keys = Formatter(self.profiles, self.ch_names).page_keys(self.with_replies(ms))
+        if any(self.profiles.cached(kind, id) is None for kind, id in keys):
+            return False
+        self.start_panes()
+        self.show_page(ms)
+        self.refresh_panes()
+        return True
+
+    def show_page(self, ms):
+        '''
+        ms must be in ts order, possibly of several channels.
+        '''
+        ms = [m for m in ms if m.get('channel') in self.ch_names]
+        if self.threads is not None:
+            self.threads.note(ms)
+        recs = [self.format_msg(m) for m in ms]
+        for pane in self.panes:
+            pane.show(recs)
+
+    def poll(self) -> ty.List[ty.Iterator[ty.List[dict]]]:
+        '''
+        Shows the first page of every due channel as one merged timeline,
+        then returns the generators of the remaining (older) pages.
+        '''
+        due = self.scheduler.due_keys(self.chs)
+        streams = [self.get_messages(ch) for ch in due]
+        firsts = [next(g, []) for g in streams]
+        self.show_page(list(heapq.merge(*firsts, key=msg_ts)))
+        for ch, page in zip(due, firsts):
+            self.scheduler.on_poll(len(page), ch)
+        for ch in due:
+            if self.index.due(ch):
+                self.rescan(ch)
+        return streams
+
+    def rescan(self, ch):
+        '''
+        Fetches the trailing window of ch again and patches what was edited or deleted since.
+        '''
+        oldest, latest = time.time() - self.index.window, self.last_ts[ch]
+        r = self.sc.conversations_history(
+            channel=ch, oldest=str(oldest), latest=str(latest), inclusive=True, limit=HISTORY_PAGE_SIZE)
+        changed, deleted = self.diff_window(ch, r, oldest, latest)
+        self.profiles.prefetch(self.formatter.page_keys(changed))
+        self.patch(ch, changed, deleted)
+
+    def diff_window(self, ch, r, oldest, latest) -> ty.Tuple[ty.List[dict], ty.List[str]]:
+        ms = []
+        for m in r.get('messages', []):
+            if m['type'] != 'message':
+                continue
+            m['channel'] = ch
+            ms.append(m)
+        if r.get('has_more') and ms:
+            # only the newest page was fetched
+            oldest = min(msg_ts(m) for m in ms)
+        return self.index.diff(ch, ms, oldest, latest)
+
+    def patch(self, ch, changed: ty.List[dict], deleted: ty.List[str]):
+        if changed:
+            changed.sort(key=msg_ts)
+            self.store.put(changed)
+            for m in changed:
+                self.formatter.discard(m)
+            self.show_page(changed)
+        if deleted:
+            self.store.delete(ch, deleted)
+            if self.threads is not None:
+                for ts in deleted:
+                    self.threads.forget((ch, ts))
+            tss = {float(ts) for ts in deleted}
+            for pane in self.panes:
+                pane.remove(ch, tss)
+
+    def fetch_threads(self):
+        '''
+        Fetches the threads which moved or are due for a check in this poll cycle and shows
+        their parents again, with the replies.
+        '''
+        parents = self.threads.take() if self.threads is not None else []
+        if len(parents) == 0:
+            return
+        from slack_sdk.errors import SlackApiError
+        rs = []
+        for m in parents:
+            try:
+                rs.append(self.sc.conversations_replies(channel=m['channel'], ts=m['ts'], limit=HISTORY_PAGE_SIZE))
+            except SlackApiError as e:
+                rs.append(None)
+                self.drop_thread(m, e)
+        parents, replies = self.put_threads(parents, rs)
+        self.profiles.prefetch(self.formatter.page_keys(replies))
+        self.show_page(sorted(parents, key=msg_ts))
+
+    def drop_thread(self, m, e):
+        # e.g. thread_not_found after the parent was deleted; the other threads go on
+        forget = e.response.status_code == 200
+        self.threads.drop(m, forget)
+        if forget:
+            self.store.put_replies(m['channel'], m['ts'], [])
+
+    def put_threads(self, parents, rs) -> ty.Tuple[ty.List[dict], ty.List[dict]]:
+        '''
+        Caches and stores the fetched threads, None in rs for a failed fetch.
+        Returns their parents and all their replies.
+        '''
+        fetched, replies = [], []
+        for m, r in zip(parents, rs):
+            if r is None:
+                continue
+            thread = self.threads.put(m, r)
+            self.store.put_replies(m['channel'], m['ts'], thread)
+            fetched.append(m)
+            replies.extend(thread)
+        # their reply_count and latest_reply may have moved
+        self.store.put(fetched)
+        return fetched, replies
+
+    def rollover(self):
+        # refresh the date format from the models, no re-fetch
+        oldest = (datetime.now() - INIT_SPAN).timestamp()
+        if any([pane.rollover(oldest) for pane in self.panes]):
+            self.store.prune(oldest)
+            if self.threads is not None:
+                self.threads.prune(oldest)
 
     def connect(self):
         must_save_token = False
@@ -132,83 +418,74 @@ class Session:
             token = token_util.ask(self.webhook_win, self.status_win, self.prompt_win)
             must_save_token = True
 
-        self.sc = WebClient(token)
-        self.init_ch()
-
-        self.status_win.erase()
-        self.webhook_win.erase()
-        initial_erase = True
-        self.webhook_win.addstr('No message in this week.')
-
-        self.last_t = datetime.now() - INIT_SPAN
+        # the client comes after the first paint from the caches; slack_sdk is slow to import
+        self.profiles = ProfileCache(None)
+        painted = self.render_cached()
+        from slack_dashboard.client_util import ScheduledWebClient
+        self.sc = self.profiles.sc = ScheduledWebClient(token, self.scheduler)
+        self.profiles.warm()
+        if not painted:
+            self.init_ch()
+            self.start_panes()
+            self.render_stored()
+            self.refresh_panes()
 
         while True:
-            if self.last_t.day != datetime.now().day and self.has_dateless_msg:
-                self.has_dateless_msg = False
-                self.last_t = datetime.now() - INIT_SPAN
-
-            m_dict = self.get_messages()
-            if initial_erase and len(m_dict) > 0:
-                self.webhook_win.erase()
-                initial_erase = False
-            for ts in sorted(m_dict.keys()):
-                self.print_msg(m_dict[ts])
-            self.webhook_win.noutrefresh()
-            curses.doupdate()
+            self.rollover()
+            try:
+                # a no-op within PROFILE_TTL, then one paginated users.list instead of lookups one by one
+                self.profiles.warm()
+                streams = self.poll()
+                self.refresh_panes()
+                for g in streams:
+                    for page in g:
+                        self.show_page(page)
+                        self.refresh_panes()
+                self.fetch_threads()
+            except NETWORK_ERRORS:
+                self.scheduler.on_network_error()
+            self.show_status()
+            self.refresh_panes()
+            self.profiles.save()
+            metrics.maybe_dump()
 
             # now all OAuth scope verified
-            if must_save_token:
+            if must_save_token and self.last_connected is not None:
                 token_util.save_default(token)
                 must_save_token = False
 
-            for _ in range(100):
-                time.sleep(0.1)
-                k = self.webhook_win.getch()
+            deadline = time.monotonic() + self.scheduler.next_delay()
+            while time.monotonic() < deadline:
+                time.sleep(INPUT_INTERVAL)
+                k = self.prompt_win.getch()
                 if k == curses.KEY_RESIZE:
                     time.sleep(1)  # wait tranquilizing
-                    while self.webhook_win.getch() != -1:  # ignore other curses.KEY_RESIZE
+                    while self.prompt_win.getch() != -1:  # ignore other curses.KEY_RESIZE
                         pass
-                    raise WindowResizeException()
-                if k == 3:  # CTRL-C
-                    raise KeyboardInterrupt('Ctrl-C')
-
-    def print_msg(self, m):
-        t = datetime.fromtimestamp(float(m['ts']))
-        if self.last_t is not None and t.day != self.last_t.day:
-            self.webhook_win.addstr('######### ' + t.strftime("%Y-%m-%d") + ' #########\n')
-        self.last_t = t
-        if 'user' in m:
-            response = self.sc.users_info(user=m['user'])
-            un = response['user']['profile']['real_name']
-        elif 'bot_id' in m:
-            if m['bot_id'] in self.bot_profile_cache:
-                un = self.bot_profile_cache[m['bot_id']]
-            else:
-                r = self.sc.bots_info(bot=m['bot_id'])
-                if 'bot' in r:
-                    un = r['bot']['name']
-                    self.bot_profile_cache[m['bot_id']] = un
+                    self.relayout()
                 else:
-                    un = 'unknown bot'
-        if 'channel' in m:
-            if m['channel'] != self.ch:
-                return
-            cn = self.ch_name
-        else:
-            cn = 'unknown'
+                    self.handle_key(k)
 
-        if t.day == datetime.now().day:
-            self.has_dateless_msg = True
-            t_str = t.strftime("%H:%M:%S")
-        else:
-            t_str = t.strftime("%Y-%m-%d %H:%M:%S")
-        cn_str = '' if cn == self.last_cn else '@' + cn
-        self.last_cn = cn
-        self.webhook_win.addstr(cn_str + '(' + t_str + ')', curses.A_UNDERLINE)
-        un_str = '' if un == self.last_un else '@' + '[' + un + ']'
-        self.last_un = un
-        self.webhook_win.addstr(un_str, curses.A_UNDERLINE | curses.A_BOLD)
-        self.webhook_win.addstr(' - ' + html.unescape(m['text']) + '\n')
+    def format_msg(self, m) -> MessageRecord:
+        key = profile_key(m)
+        un = self.profiles.name(*key) if key else UNKNOWN_USER
+        replies = ()
+        if self.threads is not None:
+            replies = tuple(self.format_msg(r) for r in self.threads.replies(m['channel'], m['ts']))
+        return MessageRecord(
+            float(m['ts']), m['channel'], self.ch_names[m['channel']], un, self.formatter.text(m), replies)
+
+
+def msg_ts(m):
+    return float(m['ts'])
+
+
+def next_cursor(r) -> ty.Optional[str]:
+    return r.get('response_metadata', {}).get('next_cursor')
+
+
+def history_args(ch, last_ts, cursor) -> dict:
+    return dict(oldest=str(last_ts), channel=ch, limit=HISTORY_PAGE_SIZE, cursor=cursor)
 
 
 if __name__ == '__main__':
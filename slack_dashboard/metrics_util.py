@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import bisect
+import threading
+import collections
+import typing as ty
+
+from slack_dashboard.config_util import env_float
+
+
+METRICS_PATH = os.environ.get('SLACK_METRICS_FILE')
+METRICS_INTERVAL = env_float('SLACK_METRICS_INTERVAL', 60.)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.)
+
+
+class Metrics:
+    '''
+    Counters of the Slack API calls and caches of this process: 'profile' (names),
+    'format' (formatted texts) and 'threads' (thread parents seen whose replies were cached).
+    Written to METRICS_PATH every METRICS_INTERVAL seconds, as Prometheus text when
+    the file name ends with '.prom', otherwise as JSON lines.
+    '''
+    def __init__(self, path=METRICS_PATH, interval=METRICS_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.last_dump = time.monotonic()
+        self.lock = threading.Lock()
+        self.calls: ty.Dict[str, int] = collections.Counter()
+        self.errors: ty.Dict[str, int] = collections.Counter()
+        self.rate_limited: ty.Dict[str, int] = collections.Counter()
+        self.latency_buckets: ty.Dict[str, ty.List[int]] = {}
+        self.latency_sum: ty.Dict[str, float] = collections.Counter()
+        self.bytes_received = 0
+        self.cache_hits: ty.Dict[str, int] = collections.Counter()
+        self.cache_misses: ty.Dict[str, int] = collections.Counter()
+
+    def observe_call(self, method, seconds, status: ty.Optional[int]):
+        with self.lock:
+            self.calls[method] += 1
+            if status is None or status >= 400:
+                self.errors[method] += 1
+            if status == 429:
+                self.rate_limited[method] += 1
+            buckets = self.latency_buckets.setdefault(method, [0] * (len(LATENCY_BUCKETS) + 1))
+            buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            self.latency_sum[method] += seconds
+
+    def observe_bytes(self, n):
+        with self.lock:
+            self.bytes_received += n
+
+    def cache_hit(self, name):
+        with self.lock:
+            self.cache_hits[name] += 1
+
+    def cache_miss(self, name):
+        with self.lock:
+            self.cache_misses[name] += 1
+
+    def summary(self) -> str:
+        with self.lock:
+            n = sum(self.calls.values())
+            if n == 0:
+                return 'API 0'
+            s = 'API %d avg %dms 429x%d %.1fMB' % (
+                n, 1000. * sum(self.latency_sum.values()) / n,
+                sum(self.rate_limited.values()), self.bytes_received / 1e6)
+            hits, misses = self.cache_hits['profile'], self.cache_misses['profile']
+            if hits + misses > 0:
+                s += ' names %d%%' % (100. * hits / (hits + misses))
+            return s
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                'time': time.time(),
+                'calls': dict(self.calls),
+                'errors': dict(self.errors),
+                'rate_limited': dict(self.rate_limited),
+                'latency_le': list(LATENCY_BUCKETS),
+                'latency_buckets': {k: list(v) for k, v in self.latency_buckets.items()},
+                'latency_sum': dict(self.latency_sum),
+                'bytes_received': self.bytes_received,
+                'cache_hits': dict(self.cache_hits),
+                'cache_misses': dict(self.cache_misses),
+            }
+
+    def prometheus(self) -> str:
+        d = self.snapshot()
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s %s' % (name, kind))
+
+        family('slack_dashboard_api_calls_total', 'counter', 'Slack API calls.')
+        for m, v in d['calls'].items():
+            lines.append('slack_dashboard_api_calls_total{method="%s"} %d' % (m, v))
+        family('slack_dashboard_api_errors_total', 'counter', 'Slack API calls failed or answered with an HTTP error.')
+        for m, v in d['errors'].items():
+            lines.append('slack_dashboard_api_errors_total{method="%s"} %d' % (m, v))
+        family('slack_dashboard_api_rate_limited_total', 'counter', 'Slack API calls answered with 429.')
+        for m, v in d['rate_limited'].items():
+            lines.append('slack_dashboard_api_rate_limited_total{method="%s"} %d' % (m, v))
+        family('slack_dashboard_api_latency_seconds', 'histogram', 'Slack API call latency.')
+        for m, buckets in d['latency_buckets'].items():
+            acc = 0
+            for le, c in zip(LATENCY_BUCKETS, buckets):
+                acc += c
+                lines.append('slack_dashboard_api_latency_seconds_bucket{method="%s",le="%g"} %d' % (m, le, acc))
+            acc += buckets[-1]
+            lines.append('slack_dashboard_api_latency_seconds_bucket{method="%s",le="+Inf"} %d' % (m, acc))
+            lines.append('slack_dashboard_api_latency_seconds_sum{method="%s"} %f' % (m, d['latency_sum'][m]))
+            lines.append('slack_dashboard_api_latency_seconds_count{method="%s"} %d' % (m, acc))
+        family('slack_dashboard_received_bytes_total', 'counter', 'Bytes received from the Slack API.')
+        lines.append('slack_dashboard_received_bytes_total %d' % d['bytes_received'])
+        family('slack_dashboard_cache_hits_total', 'counter', 'Cache hits.')
+        for c, v in d['cache_hits'].items():
+            lines.append('slack_dashboard_cache_hits_total{cache="%s"} %d' % (c, v))
+        family('slack_dashboard_cache_misses_total', 'counter', 'Cache misses.')
+        for c, v in d['cache_misses'].items():
+            lines.append('slack_dashboard_cache_misses_total{cache="%s"} %d' % (c, v))
+        return '\n'.join(lines) + '\n'
+
+    def maybe_dump(self):
+        if not self.path or time.monotonic() - self.last_dump < self.interval:
+            return
+        self.last_dump = time.monotonic()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if self.path.endswith('.prom'):
+            # scrapers must never see a half written file
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(self.prometheus())
+            os.replace(tmp_path, self.path)
+        else:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(self.snapshot()) + '\n')
+
+
+metrics = Metrics()
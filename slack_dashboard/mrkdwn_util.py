@@ -0,0 +1,92 @@
+import re
+import html
+import collections
+import typing as ty
+
+from slack_dashboard.config_util import env_int
+from slack_dashboard.metrics_util import metrics
+from slack_dashboard.profile_util import ProfileCache, profile_key
+
+FORMAT_CACHE_SIZE = env_int('SLACK_FORMAT_CACHE_SIZE', 10000)
+
+# <@U...>, <#C...|name>, <!subteam^S...|@handle>, <!here>, <url|label> and HTML entities, in one pass
+TOKEN_RE = re.compile(r'<([@#!]?)([^<>|]*)(?:\|([^<>]*))?>|&#?\w+;')
+SPECIAL_MENTIONS = ('here', 'channel', 'everyone')
+
+
+def references(text) -> ty.Iterator[ty.Tuple[str, str]]:
+    '''
+    Yields the (kind, id) names text refers to without a label.
+    '''
+    for sigil, target, label in TOKEN_RE.findall(text):
+        if sigil == '@':
+            yield 'user', target
+        elif sigil == '#' and not label:
+            yield 'channel', target
+        elif sigil == '!' and target.startswith('subteam^') and not label:
+            yield 'subteam', target[len('subteam^'):]
+
+
+class Formatter:
+    '''
+    Turns Slack mrkdwn into plain text, names resolved through profiles.
+    Texts are cached by (channel, ts, edited ts), so an edit is formatted again.
+    '''
+    def __init__(self, profiles: ProfileCache, ch_names: ty.Dict[str, str], size=FORMAT_CACHE_SIZE):
+        self.profiles = profiles
+        self.ch_names = ch_names
+        self.size = size
+        self.cache: ty.Dict[tuple, str] = collections.OrderedDict()
+
+    def page_keys(self, ms) -> ty.Set[ty.Tuple[str, str]]:
+        '''
+        The names needed to show ms: authors and names referred to in the texts.
+        Resolve them in one go with ProfileCache.prefetch() before formatting.
+        '''
+        keys = set()
+        for m in ms:
+            key = profile_key(m)
+            if key is not None:
+                keys.add(key)
+            keys.update(k for k in references(m.get('text', '')) if k[1] not in self.ch_names)
+        return keys
+
+    def text(self, m) -> str:
+        key = format_key(m)
+        s = self.cache.get(key)
+        if s is not None:
+            metrics.cache_hit('format')
+            self.cache.move_to_end(key)
+            return s
+        metrics.cache_miss('format')
+        s = TOKEN_RE.sub(self.substitute, m.get('text', ''))
+        self.cache[key] = s
+        if len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+        return s
+
+    def discard(self, m):
+        # for changes which don't move edited.ts, e.g. a deleted thread parent
+        self.cache.pop(format_key(m), None)
+
+    def substitute(self, match) -> str:
+        sigil, target, label = match.groups()
+        if sigil is None:
+            return html.unescape(match.group(0))
+        label = html.unescape(label or '')
+        if sigil == '@':
+            return '@' + self.profiles.name('user', target)
+        if sigil == '#':
+            return '#' + (label or self.ch_names.get(target) or self.profiles.name('channel', target))
+        if sigil == '!':
+            if target.startswith('subteam^'):
+                return label or '@' + self.profiles.name('subteam', target[len('subteam^'):])
+            if target in SPECIAL_MENTIONS:
+                return '@' + target
+            # e.g. <!date^...|fallback>
+            return label or '<' + target + '>'
+        return label or html.unescape(target)
+
+
+def format_key(m) -> tuple:
+    return m.get('channel'), m['ts'], m.get('edited', {}).get('ts')
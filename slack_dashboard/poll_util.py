@@ -0,0 +1,116 @@
+import time
+import random
+import collections
+import typing as ty
+
+from slack_dashboard.config_util import env_float
+
+
+POLL_MIN = env_float('SLACK_POLL_MIN', 2.)
+POLL_MAX = env_float('SLACK_POLL_MAX', 20.)
+POLL_DECAY = 1.5
+BACKOFF_BASE = 2.
+BACKOFF_MAX = 300.
+DEFAULT_RETRY_AFTER = 30.
+
+# https://api.slack.com/docs/rate-limits
+TIER_PER_MINUTE = {1: 1, 2: 20, 3: 50, 4: 100}
+METHOD_TIERS = {
+    'bots.info': 3,
+    'conversations.history': 3,
+    'conversations.info': 3,
+    'conversations.replies': 3,
+    'usergroups.list': 2,
+    'users.conversations': 3,
+    'users.info': 4,
+    'users.list': 2,
+}
+
+
+class Scheduler:
+    '''
+    Decides when to poll and when a Slack API method may be called.
+    Polls each key (channel) fast after its activity and decays toward POLL_MAX when quiet,
+    honors Retry-After and the method tiers, and backs off on network errors.
+    Lives across Sessions, so its state survives a reconnect.
+    '''
+    def __init__(self, poll_min=POLL_MIN, poll_max=POLL_MAX):
+        self.poll_min = poll_min
+        self.poll_max = max(poll_min, poll_max)
+        self.intervals: ty.Dict[str, float] = {}
+        self.due: ty.Dict[str, float] = {}
+        self.n_error = 0
+        self.backoff = 0.
+        self.blocked_until: ty.Dict[str, float] = {}
+        self.calls: ty.Dict[str, ty.Deque[float]] = {}
+
+    def delay_for(self, method) -> float:
+        now = time.monotonic()
+        d = self.blocked_until.get(method, 0.) - now
+        tier = METHOD_TIERS.get(method)
+        calls = self.calls.get(method)
+        if tier is not None and calls:
+            # at most TIER_PER_MINUTE calls in any 60 seconds; bursts are fine
+            while calls and calls[0] <= now - 60.:
+                calls.popleft()
+            if len(calls) >= TIER_PER_MINUTE[tier]:
+                d = max(d, calls[0] + 60. - now)
+        return max(d, 0.)
+
+    def note_call(self, method):
+        if method in METHOD_TIERS:
+            self.calls.setdefault(method, collections.deque()).append(time.monotonic())
+
+    def on_rate_limited(self, method, retry_after: ty.Optional[float]):
+        if retry_after is None:
+            retry_after = DEFAULT_RETRY_AFTER
+        self.blocked_until[method] = time.monotonic() + retry_after
+
+    def on_poll(self, n_new, key=''):
+        self.n_error = 0
+        self.backoff = 0.
+        if n_new > 0:
+            interval = self.poll_min
+        else:
+            interval = min(self.intervals.get(key, self.poll_min) * POLL_DECAY, self.poll_max)
+        self.intervals[key] = interval
+        self.due[key] = time.monotonic() + interval
+
+    def due_keys(self, keys: ty.Iterable[str]) -> ty.List[str]:
+        now = time.monotonic()
+        return [k for k in keys if self.due.get(k, 0.) <= now]
+
+    def on_network_error(self) -> float:
+        self.n_error += 1
+        # the exponent clamped, or a long outage overflows the float
+        d = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** min(self.n_error, 16))
+        self.backoff = random.uniform(d / 2, d)
+        return self.backoff
+
+    def next_delay(self, method='conversations.history') -> float:
+        if self.backoff > 0.:
+            return self.backoff
+        d = min(self.due.values()) - time.monotonic() if self.due else 0.
+        return max(d, self.delay_for(method), 0.)
+
+    def interval(self) -> float:
+        return min(self.intervals.values()) if self.intervals else self.poll_min
+
+    def status(self) -> str:
+        if self.backoff > 0.:
+            return 'Network error, retry in %ds' % self.backoff
+        now = time.monotonic()
+        if any(t > now for t in self.blocked_until.values()):
+            return 'Rate limited, poll %.1fs' % self.next_delay()
+        return 'Poll %.1fs' % self.interval()
+
+
+def retry_after(response) -> ty.Optional[float]:
+    headers = response.headers or {}
+    v = headers.get('Retry-After', headers.get('retry-after'))
+    if isinstance(v, list):
+        v = v[0] if v else None
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,279 @@
+import os
+import json
+import time
+import threading
+import typing as ty
+
+import appdirs
+from slack_dashboard import APP_NAME
+from slack_dashboard.metrics_util import metrics
+
+
+PROFILE_PATH = os.path.join(appdirs.user_config_dir(APP_NAME), "profile_cache.json")
+PROFILE_TTL = 24 * 60 * 60.
+USERS_LIST_LIMIT = 1000
+PROFILE_CONCURRENCY = 8
+UNKNOWN_USER = 'unknown'
+UNKNOWN_BOT = 'unknown bot'
+
+
+class ProfileCache:
+    '''
+    Display names of users, bots, channels and user groups, keyed by 'user:U...' / 'bot:B...' /
+    'channel:C...' / 'subteam:S...'.
+    Warmed in bulk by users.list, persisted to the config dir and refreshed after PROFILE_TTL.
+    '''
+    def __init__(self, sc, path=PROFILE_PATH, ttl=PROFILE_TTL):
+        self.sc = sc
+        self.path = path
+        self.ttl = ttl
+        self.entries: ty.Dict[str, ty.Tuple[str, float]] = {}
+        self.warmed_at = 0.
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.in_flight: ty.Dict[str, threading.Event] = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                d = json.load(f)
+            self.entries = {k: (v[0], v[1]) for k, v in d['entries'].items()}
+            self.warmed_at = d['warmed_at']
+        except (IOError, ValueError, KeyError, TypeError, IndexError):
+            self.entries = {}
+            self.warmed_at = 0.
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            d = {'warmed_at': self.warmed_at, 'entries': self.entries}
+            self.dirty = False
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(d, f)
+        os.replace(tmp_path, self.path)
+
+    def warm(self):
+        if time.time() - self.warmed_at < self.ttl:
+            return
+        now = time.time()
+        fetched = {}
+        cursor = None
+        while True:
+            r = self.sc.users_list(limit=USERS_LIST_LIMIT, cursor=cursor)
+            cursor = self.add_members(r, now, fetched)
+            if not cursor:
+                break
+        self.update_warmed(fetched, now)
+
+    @staticmethod
+    def add_members(r, now, fetched):
+        '''
+        Puts a users.list page into fetched and returns the next cursor.
+        '''
+        for u in r.get('members', []):
+            profile = u.get('profile', {})
+            un = profile.get('real_name') or u.get('real_name') or u.get('name') or UNKNOWN_USER
+            fetched['user:' + u['id']] = (un, now)
+            if profile.get('bot_id'):
+                fetched['bot:' + profile['bot_id']] = (un, now)
+        return r.get('response_metadata', {}).get('next_cursor')
+
+    def update_warmed(self, fetched, now):
+        with self.lock:
+            self.entries.update(fetched)
+            self.warmed_at = now
+            self.dirty = True
+
+    def cached(self, kind, id) -> ty.Optional[str]:
+        with self.lock:
+            e = self.entries.get(kind + ':' + id)
+        if e is not None and time.time() - e[1] < self.ttl:
+            return e[0]
+        return None
+
+    def put(self, kind, id, un):
+        with self.lock:
+            self.entries[kind + ':' + id] = (un, time.time())
+            self.dirty = True
+
+    def name(self, kind, id):
+        key = kind + ':' + id
+        while True:
+            with self.lock:
+                e = self.entries.get(key)
+                if e is not None and time.time() - e[1] < self.ttl:
+                    metrics.cache_hit('profile')
+                    return e[0]
+                ev = self.in_flight.get(key)
+                is_owner = ev is None
+                if is_owner:
+                    ev = threading.Event()
+                    self.in_flight[key] = ev
+            if is_owner:
+                break
+            # Another caller is fetching the same key; share its result.
+            ev.wait()
+
+        metrics.cache_miss('profile')
+        try:
+            un = self.fetch(kind, id)
+            self.put(kind, id, un)
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            ev.set()
+        return un
+
+    def prefetch(self, keys):
+        '''
+        Resolves the (kind, id) keys, e.g. Formatter.page_keys() of a page, each at most once.
+        '''
+        for kind, id in keys:
+            self.name(kind, id)
+
+    def fetch(self, kind, id):
+        from slack_sdk.errors import SlackApiError
+        try:
+            return self.fetched_name(kind, id, lookup(self.sc, kind, id))
+        except SlackApiError as e:
+            return failed_name(e, kind, id)
+
+    def fetched_name(self, kind, id, r):
+        '''
+        The name in the response r of lookup().
+        '''
+        if kind == 'subteam':
+            return self.add_usergroups(r, id)
+        return profile_name(kind, r)
+
+    def add_usergroups(self, r, id):
+        '''
+        Puts every group of a usergroups.list response and returns the name of id.
+        '''
+        for g in r.get('usergroups', []):
+            self.put('subteam', g['id'], g.get('handle') or g.get('name') or g['id'])
+        return self.cached('subteam', id) or unknown_name('subteam', id)
+
+
+# kind -> the method telling its names and the argument taking the id (None: lists them all)
+LOOKUPS = {
+    'user': ('users_info', 'user'),
+    'bot': ('bots_info', 'bot'),
+    'channel': ('conversations_info', 'channel'),
+    'subteam': ('usergroups_list', None),
+}
+
+
+def lookup(sc, kind, id):
+    '''
+    Calls the method telling the name of id; a coroutine with an AsyncWebClient.
+    '''
+    method, arg = LOOKUPS[kind]
+    return getattr(sc, method)(**({arg: id} if arg else {}))
+
+
+def profile_key(m) -> ty.Optional[ty.Tuple[str, str]]:
+    if 'user' in m:
+        return 'user', m['user']
+    if 'bot_id' in m:
+        return 'bot', m['bot_id']
+    return None
+
+
+def profile_name(kind, r):
+    if kind == 'user':
+        return r['user']['profile']['real_name']
+    if kind == 'channel':
+        return r['channel']['name']
+    if 'bot' in r:
+        return r['bot']['name']
+    return UNKNOWN_BOT
+
+
+def unknown_name(kind, id):
+    if kind == 'user':
+        return UNKNOWN_USER
+    if kind == 'bot':
+        return UNKNOWN_BOT
+    return id
+
+
+def failed_name(e, kind, id):
+    '''
+    The name to cache when Slack refused a lookup, e.g. a channel we can't see
+    or a token without the usergroups:read scope. Server errors aren't cached.
+    '''
+    if e.response.status_code != 200:
+        raise e
+    return unknown_name(kind, id)
+
+
+class AsyncProfileCache(ProfileCache):
+    '''
+    ProfileCache for AsyncWebClient. Resolve with prefetch() before formatting;
+    name() then never touches the network.
+    '''
+    def __init__(self, sc, path=PROFILE_PATH, ttl=PROFILE_TTL, concurrency=PROFILE_CONCURRENCY):
+        super().__init__(sc, path, ttl)
+        import asyncio  # only the async engine pays for it
+        self.sem = asyncio.Semaphore(concurrency)
+        self.futures: ty.Dict[str, 'asyncio.Future'] = {}
+
+    async def warm(self):
+        if time.time() - self.warmed_at < self.ttl:
+            return
+        now = time.time()
+        fetched = {}
+        cursor = None
+        while True:
+            r = await self.sc.users_list(limit=USERS_LIST_LIMIT, cursor=cursor)
+            cursor = self.add_members(r, now, fetched)
+            if not cursor:
+                break
+        self.update_warmed(fetched, now)
+
+    def name(self, kind, id):
+        un = self.cached(kind, id)
+        if un is not None:
+            return un
+        return unknown_name(kind, id)
+
+    async def prefetch(self, keys):
+        import asyncio
+        # one usergroups.list answers all user groups
+        await asyncio.gather(*[self.resolve(kind, id) for kind, id in keys if kind != 'subteam'])
+        for kind, id in keys:
+            if kind == 'subteam':
+                await self.resolve(kind, id)
+
+    async def resolve(self, kind, id):
+        un = self.cached(kind, id)
+        if un is not None:
+            metrics.cache_hit('profile')
+            return un
+        key = kind + ':' + id
+        fut = self.futures.get(key)
+        if fut is not None:
+            # another caller is fetching the same key; like ProfileCache.name(), a hit for this one
+            metrics.cache_hit('profile')
+        else:
+            import asyncio
+            metrics.cache_miss('profile')
+            fut = asyncio.ensure_future(self.fetch_async(kind, id))
+            self.futures[key] = fut
+            fut.add_done_callback(lambda _: self.futures.pop(key, None))
+        return await fut
+
+    async def fetch_async(self, kind, id):
+        from slack_sdk.errors import SlackApiError
+        try:
+            async with self.sem:
+                un = self.fetched_name(kind, id, await lookup(self.sc, kind, id))
+        except SlackApiError as e:
+            un = failed_name(e, kind, id)
+        self.put(kind, id, un)
+        return un
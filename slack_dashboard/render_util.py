@@ -0,0 +1,308 @@
+import heapq
+import curses
+import collections
+import unicodedata
+import typing as ty
+from datetime import datetime, date
+
+from slack_dashboard.config_util import env_int
+
+
+NO_MESSAGE = 'No message in this week.'
+REPLY_INDENT = '    '
+SCROLLBACK = env_int('SLACK_SCROLLBACK', 5000)
+
+Row = ty.Tuple[ty.Tuple[str, int], ...]
+
+
+class MessageRecord:
+    __slots__ = ('ts', 'ch', 'cn', 'un', 'text', 'replies', 'rows')
+
+    def __init__(self, ts: float, ch: str, cn: str, un: str, text: str,
+                 replies: ty.Tuple['MessageRecord', ...] = ()):
+        self.ts = ts
+        self.ch = ch
+        self.cn = cn
+        self.un = un
+        self.text = text
+        self.replies = replies
+        # wrapped rows for the current width, laid out lazily
+        self.rows: ty.Optional[ty.Tuple[Row, ...]] = None
+
+    @property
+    def t(self) -> datetime:
+        return datetime.fromtimestamp(self.ts)
+
+
+class RenderModel:
+    '''
+    The newest `scrollback` messages in ts order. Only the rows in the viewport are laid out
+    and painted, so memory and paint cost don't grow with the history.
+    '''
+    def __init__(self, scrollback=SCROLLBACK):
+        self.records: ty.Deque[MessageRecord] = collections.deque(maxlen=scrollback)
+        self.width = 0
+        self.layout_date = date.today()
+        self.scroll = 0  # rows above the bottom
+
+    def add_many(self, recs: ty.List[MessageRecord]):
+        '''
+        recs must be in ts order.
+        '''
+        if len(recs) == 0:
+            return
+        if len(self.records) == 0 or self.records[-1].ts < recs[0].ts:
+            if self.scroll > 0:
+                # keep the scrolled view where it is
+                prev = self.records[-1] if self.records else None
+                for rec in recs:
+                    self.scroll += len(self.layout(rec, prev))
+                    prev = rec
+            self.records.extend(recs)
+        else:
+            merged: ty.List[MessageRecord] = []
+            at: ty.Dict[ty.Tuple[str, float], int] = {}  # (ch, ts) -> index in merged
+            stale = False
+            for rec in heapq.merge(self.records, recs, key=lambda r: r.ts):
+                fresh = rec.rows is None
+                i = at.get((rec.ch, rec.ts))
+                if i is not None:
+                    # a newer version, e.g. edited; other channels' messages of the same ts may be in between
+                    merged[i] = rec
+                    if i + 1 < len(merged):
+                        merged[i + 1].rows = None
+                else:
+                    if stale:
+                        # the header depends on the previous message
+                        rec.rows = None
+                    at[(rec.ch, rec.ts)] = len(merged)
+                    merged.append(rec)
+                stale = fresh
+            self.records = collections.deque(merged, maxlen=self.records.maxlen)
+        if len(self.records) == self.records.maxlen:
+            # the oldest one may have lost its predecessor
+            self.records[0].rows = None
+
+    def remove(self, ch, tss: ty.Set[float]) -> bool:
+        kept: ty.List[MessageRecord] = []
+        stale = False
+        for rec in self.records:
+            if rec.ch == ch and rec.ts in tss:
+                stale = True
+                continue
+            if stale:
+                # the header depends on the previous message
+                rec.rows = None
+                stale = False
+            kept.append(rec)
+        if len(kept) == len(self.records):
+            return False
+        self.records = collections.deque(kept, maxlen=self.records.maxlen)
+        return True
+
+    def prune(self, oldest: float):
+        while self.records and self.records[0].ts < oldest:
+            self.records.popleft()
+        if self.records:
+            self.records[0].rows = None
+
+    def invalidate(self):
+        for rec in self.records:
+            rec.rows = None
+
+    def set_width(self, width):
+        if width != self.width:
+            self.width = width
+            self.invalidate()
+
+    def rollover(self) -> bool:
+        if self.layout_date == date.today():
+            return False
+        self.layout_date = date.today()
+        self.invalidate()
+        return True
+
+    def layout(self, rec: MessageRecord, prev: ty.Optional[MessageRecord]) -> ty.Tuple[Row, ...]:
+        if rec.rows is not None:
+            return rec.rows
+        t = rec.t
+        lines: ty.List[ty.List[ty.Tuple[str, int]]] = []
+        if prev is None or t.date() != prev.t.date():
+            lines.append([('######### ' + t.strftime("%Y-%m-%d") + ' #########', 0)])
+
+        cn_str = '' if prev is not None and rec.cn == prev.cn else '@' + rec.cn
+        # after replies, the author is named again
+        same_un = prev is not None and rec.un == prev.un and not prev.replies
+        un_str = '' if same_un else '@' + '[' + rec.un + ']'
+        text_lines = rec.text.replace('\t', ' ').split('\n')
+        lines.append([
+            (cn_str + '(' + self.time_str(t) + ')', curses.A_UNDERLINE),
+            (un_str, curses.A_UNDERLINE | curses.A_BOLD),
+            (' - ' + text_lines[0], 0)])
+        lines.extend([[(line, 0)] for line in text_lines[1:]])
+        for reply in rec.replies:
+            text_lines = reply.text.replace('\t', ' ').split('\n')
+            lines.append([
+                (REPLY_INDENT + '(' + self.time_str(reply.t) + ')', curses.A_UNDERLINE),
+                ('@[' + reply.un + ']', curses.A_UNDERLINE | curses.A_BOLD),
+                (' - ' + text_lines[0], 0)])
+            lines.extend([[(REPLY_INDENT + line, 0)] for line in text_lines[1:]])
+
+        rows: ty.List[Row] = []
+        for line in lines:
+            rows.extend(wrap(line, self.width))
+        rec.rows = tuple(rows)
+        return rec.rows
+
+    def time_str(self, t: datetime) -> str:
+        if t.date() == self.layout_date:
+            return t.strftime("%H:%M:%S")
+        return t.strftime("%Y-%m-%d %H:%M:%S")
+
+    def visible_rows(self, h) -> ty.List[Row]:
+        chunks: ty.List[ty.Tuple[Row, ...]] = []
+        n = 0
+        it = reversed(self.records)
+        rec = next(it, None)
+        while rec is not None and n < h + self.scroll:
+            prev = next(it, None)
+            rows = self.layout(rec, prev)
+            chunks.append(rows)
+            n += len(rows)
+            rec = prev
+        if rec is None:
+            # reached the oldest message
+            self.scroll = min(self.scroll, max(n - h, 0))
+        rows = [row for chunk in reversed(chunks) for row in chunk]
+        end = len(rows) - self.scroll
+        return rows[max(end - h, 0):end]
+
+
+class Pane:
+    '''
+    A viewport showing the messages of one channel, or of all channels when channel is None.
+    Painted through a pad of the viewport size. Only the rows which differ from the painted
+    ones are drawn again; when the view moved up (new messages), the pad is scrolled first.
+    A title, e.g. the channel name of a tiled pane, takes a header row of its own.
+    '''
+    def __init__(self, channel: ty.Optional[str] = None, title: ty.Optional[str] = None):
+        self.channel = channel
+        self.title = title
+        self.model = RenderModel()
+        self.pad = None
+        self.header = None
+        self.painted: ty.List[Row] = []  # rows on the pad, top to bottom
+        self.top = 0
+        self.h = 1
+        self.w = 1
+
+    def place(self, top, h, w):
+        self.top, self.h, self.w = top, max(h, 1), max(w, 1)
+        self.header = None
+        if self.title is not None and self.h > 1:
+            self.header = curses.newwin(1, self.w, self.top, 0)
+            self.header.addstr(0, 0, self.title[:self.w - 1], curses.A_REVERSE)
+            self.top += 1
+            self.h -= 1
+        # one spare row, so the bottom right cell can be written
+        self.pad = curses.newpad(self.h + 1, self.w)
+        self.pad.idlok(True)
+        self.painted = []
+        self.model.set_width(self.w)
+
+    def show(self, recs: ty.List[MessageRecord]):
+        if self.channel is not None:
+            recs = [r for r in recs if r.ch == self.channel]
+        if len(recs) == 0:
+            return
+        self.model.add_many(recs)
+        self.paint()
+
+    def remove(self, ch, tss: ty.Set[float]):
+        if self.channel is not None and self.channel != ch:
+            return
+        if self.model.remove(ch, tss):
+            self.paint()
+
+    def paint(self):
+        if len(self.model.records) == 0:
+            rows: ty.List[Row] = [((NO_MESSAGE[:self.w], 0),)]
+        else:
+            rows = self.model.visible_rows(self.h)
+        painted = self.painted
+        n = scroll_shift(painted, rows)
+        if n > 0:
+            self.pad.scrollok(True)
+            self.pad.scroll(n)
+            self.pad.scrollok(False)
+            # curses' line shift hints of a scrolled pad don't match the screen; copy it whole
+            self.pad.touchwin()
+            painted = painted[n:]
+        for y, row in enumerate(rows):
+            if y < len(painted) and painted[y] == row:
+                continue
+            self.pad.move(y, 0)
+            self.pad.clrtoeol()
+            for s, attr in row:
+                self.pad.addstr(s, attr)
+        for y in range(len(rows), len(painted)):
+            self.pad.move(y, 0)
+            self.pad.clrtoeol()
+        self.painted = rows
+
+    def noutrefresh(self):
+        if self.header is not None:
+            self.header.noutrefresh()
+        self.pad.noutrefresh(0, 0, self.top, 0, self.top + self.h - 1, self.w - 1)
+
+    def scroll_page(self, pages):
+        self.model.scroll = max(self.model.scroll + pages * max(self.h - 1, 1), 0)
+        self.paint()
+
+    def rollover(self, oldest: float) -> bool:
+        if not self.model.rollover():
+            return False
+        self.model.prune(oldest)
+        self.paint()
+        return True
+
+
+def scroll_shift(old: ty.List[Row], new: ty.List[Row]) -> int:
+    '''
+    The number of rows old has to be scrolled up by so that it starts like new, or 0.
+    '''
+    if not old or not new or old[0] == new[0]:
+        return 0
+    for n in range(1, len(old)):
+        if old[n] == new[0] and old[n:n + len(new)] == new[:len(old) - n]:
+            return n
+    return 0
+
+
+def char_width(c) -> int:
+    if unicodedata.combining(c):
+        return 0
+    return 2 if unicodedata.east_asian_width(c) in 'WF' else 1
+
+
+def wrap(segments: ty.List[ty.Tuple[str, int]], width) -> ty.List[Row]:
+    rows: ty.List[Row] = []
+    row: ty.List[ty.Tuple[str, int]] = []
+    col = 0
+    for s, attr in segments:
+        buf = ''
+        for c in s:
+            w = char_width(c)
+            if col + w > width and col > 0:
+                if buf:
+                    row.append((buf, attr))
+                    buf = ''
+                rows.append(tuple(row))
+                row = []
+                col = 0
+            buf += c
+            col += w
+        if buf:
+            row.append((buf, attr))
+    rows.append(tuple(row))
+    return rows
@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import sqlite3
+import collections
+import typing as ty
+
+import appdirs
+from slack_dashboard import APP_NAME
+from slack_dashboard.config_util import env_float
+
+
+STORE_PATH = os.path.join(appdirs.user_data_dir(APP_NAME), "messages.sqlite3")
+RESCAN_WINDOW = env_float('SLACK_RESCAN_WINDOW', 60 * 60.)
+RESCAN_INTERVAL = env_float('SLACK_RESCAN_INTERVAL', 60.)
+
+
+class MessageStore:
+    '''
+    Messages already fetched from Slack, keyed by (channel, ts).
+    Lets a new Session render at once and ask Slack only for the newer ones.
+    '''
+    def __init__(self, path=STORE_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS messages (
+            channel TEXT NOT NULL,
+            ts TEXT NOT NULL,
+            t REAL NOT NULL,
+            body TEXT NOT NULL,
+            PRIMARY KEY (channel, ts))''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS messages_t ON messages (channel, t)')
+        # thread replies, by the parent's ts (thread_ts) and time (thread_t)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS replies (
+            channel TEXT NOT NULL,
+            thread_ts TEXT NOT NULL,
+            thread_t REAL NOT NULL,
+            ts TEXT NOT NULL,
+            t REAL NOT NULL,
+            body TEXT NOT NULL,
+            PRIMARY KEY (channel, thread_ts, ts))''')
+        # the ts up to which every message of the channel has been fetched
+        self.db.execute('''CREATE TABLE IF NOT EXISTS synced (
+            channel TEXT PRIMARY KEY,
+            t REAL NOT NULL)''')
+        self.db.commit()
+
+    def put(self, ms: ty.Iterable[dict]):
+        self.db.executemany(
+            'INSERT OR REPLACE INTO messages (channel, ts, t, body) VALUES (?, ?, ?, ?)',
+            [(m['channel'], m['ts'], float(m['ts']), json.dumps(m)) for m in ms])
+        self.db.commit()
+
+    def messages(self, channels: ty.List[str], oldest: float, limit=-1) -> ty.List[dict]:
+        '''
+        The newest limit (-1: all) messages of all the channels in one ts ordered timeline.
+        '''
+        cur = self.db.execute(
+            'SELECT body FROM messages WHERE channel IN (%s) AND t >= ? ORDER BY t DESC LIMIT ?'
+            % ', '.join('?' * len(channels)),
+            (*channels, oldest, limit))
+        return [json.loads(r[0]) for r in reversed(cur.fetchall())]
+
+    def put_replies(self, channel, thread_ts, replies: ty.Iterable[dict]):
+        '''
+        Replaces the replies kept for the thread of thread_ts.
+        '''
+        self.db.execute('DELETE FROM replies WHERE channel = ? AND thread_ts = ?', (channel, thread_ts))
+        self.db.executemany(
+            'INSERT OR REPLACE INTO replies (channel, thread_ts, thread_t, ts, t, body) VALUES (?, ?, ?, ?, ?, ?)',
+            [(channel, thread_ts, float(thread_ts), m['ts'], float(m['ts']), json.dumps(m)) for m in replies])
+        self.db.commit()
+
+    def replies(self, channels: ty.List[str], oldest: float) -> ty.Dict[ty.Tuple[str, str], ty.List[dict]]:
+        '''
+        The replies of the threads started since oldest, by (channel, thread_ts), oldest thread first.
+        '''
+        cur = self.db.execute(
+            'SELECT channel, thread_ts, body FROM replies WHERE channel IN (%s) AND thread_t >= ? ORDER BY thread_t, t'
+            % ', '.join('?' * len(channels)),
+            (*channels, oldest))
+        threads: ty.Dict[ty.Tuple[str, str], ty.List[dict]] = {}
+        for ch, thread_ts, body in cur:
+            threads.setdefault((ch, thread_ts), []).append(json.loads(body))
+        return threads
+
+    def synced_ts(self, channel) -> ty.Optional[float]:
+        '''
+        Not the newest stored ts: a backfill stopped halfway stores the newest pages first.
+        '''
+        r = self.db.execute('SELECT t FROM synced WHERE channel = ?', (channel,)).fetchone()
+        return r[0] if r else None
+
+    def set_synced(self, channel, t: float):
+        self.db.execute('INSERT OR REPLACE INTO synced (channel, t) VALUES (?, ?)', (channel, t))
+        self.db.commit()
+
+    def delete(self, channel, tss: ty.Iterable[str]):
+        keys = [(channel, ts) for ts in tss]
+        self.db.executemany('DELETE FROM messages WHERE channel = ? AND ts = ?', keys)
+        self.db.executemany('DELETE FROM replies WHERE channel = ? AND thread_ts = ?', keys)
+        self.db.commit()
+
+    def prune(self, oldest: float):
+        self.db.execute('DELETE FROM messages WHERE t < ?', (oldest,))
+        self.db.execute('DELETE FROM replies WHERE thread_t < ?', (oldest,))
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+class MessageIndex:
+    '''
+    What we last saw of the messages in the trailing `window` seconds, by channel and ts.
+    Fetching that window again every `interval` seconds and diffing it against the index
+    tells which messages were edited, got thread replies or were deleted.
+    '''
+    def __init__(self, window=RESCAN_WINDOW, interval=RESCAN_INTERVAL):
+        self.window = window
+        self.interval = interval
+        self.entries: ty.Dict[str, ty.Dict[str, tuple]] = collections.defaultdict(dict)
+        self.rescanned_at: ty.Dict[str, float] = {}
+
+    def add(self, ms: ty.Iterable[dict]):
+        oldest = time.time() - self.window
+        for m in ms:
+            if float(m['ts']) >= oldest:
+                self.entries[m['channel']][m['ts']] = signature(m)
+                self.rescanned_at.setdefault(m['channel'], time.monotonic())
+
+    def due(self, ch) -> bool:
+        if len(self.entries[ch]) == 0:
+            return False
+        return time.monotonic() - self.rescanned_at.get(ch, 0.) >= self.interval
+
+    def diff(self, ch, ms: ty.List[dict], oldest: float, latest: float) -> ty.Tuple[ty.List[dict], ty.List[str]]:
+        '''
+        ms are all the messages of ch between oldest and latest, as Slack has them now.
+        Returns the changed (or missed) messages among them and the ts of the deleted ones.
+        '''
+        self.rescanned_at[ch] = time.monotonic()
+        es = self.entries[ch]
+        cutoff = time.time() - self.window
+        for ts in [ts for ts in es if float(ts) < cutoff]:
+            del es[ts]
+
+        changed = []
+        for m in ms:
+            sig = signature(m)
+            if es.get(m['ts']) != sig:
+                es[m['ts']] = sig
+                changed.append(m)
+        seen = {m['ts'] for m in ms}
+        deleted = [ts for ts in es if ts not in seen and oldest <= float(ts) <= latest]
+        for ts in deleted:
+            del es[ts]
+        return changed, deleted
+
+
+def signature(m) -> tuple:
+    return m.get('edited', {}).get('ts'), m.get('latest_reply'), m.get('subtype'), m.get('text')
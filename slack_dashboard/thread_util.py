@@ -0,0 +1,144 @@
+import time
+import collections
+import typing as ty
+
+from slack_dashboard.config_util import env_int, env_flag
+from slack_dashboard.metrics_util import metrics
+from slack_dashboard.store_util import RESCAN_WINDOW, RESCAN_INTERVAL
+
+THREADS = env_flag('SLACK_THREADS')
+THREAD_CACHE_SIZE = env_int('SLACK_THREAD_CACHE_SIZE', 200)
+# conversations.replies is Tier 3 (50 a minute); the checks of old threads stay well below
+THREAD_CHECKS_PER_MINUTE = env_int('SLACK_THREAD_CHECKS_PER_MINUTE', 10)
+THREAD_FETCH_MAX = 20  # threads fetched in one poll cycle
+
+
+class ThreadCache:
+    '''
+    Replies of threads, by (channel, parent ts), the least recently used dropped beyond `size`.
+    A thread is queued for fetching only when its parent's latest_reply moved, so the cost follows
+    thread activity, not the threads on screen. A thread not cached yet is queued only when that
+    is within `window` seconds.
+    The rescan sees a parent again only within `window` seconds. A cached thread with an older
+    parent is checked instead, at most every `interval` * (its parent's age / `window`) seconds,
+    less often as it ages, and no more than `checks_per_minute` threads a minute, the most overdue
+    first, so that the cost doesn't grow with the cached threads.
+    '''
+    def __init__(self, size=THREAD_CACHE_SIZE, window=RESCAN_WINDOW, interval=RESCAN_INTERVAL,
+                 checks_per_minute=THREAD_CHECKS_PER_MINUTE, fetch_max=THREAD_FETCH_MAX):
+        self.size = size
+        self.window = window
+        self.interval = interval
+        self.checks_per_minute = checks_per_minute
+        self.fetch_max = fetch_max
+        self.checks: ty.Deque[float] = collections.deque()  # when the checks in the last minute were queued
+        # (channel, ts) -> (latest_reply, replies)
+        self.threads: ty.Dict[ty.Tuple[str, str], ty.Tuple[str, ty.List[dict]]] = collections.OrderedDict()
+        # the parents of the cached threads, for the periodic checks
+        self.parents: ty.Dict[ty.Tuple[str, str], dict] = {}
+        self.checked_at: ty.Dict[ty.Tuple[str, str], float] = {}
+        self.pending: ty.Dict[ty.Tuple[str, str], dict] = {}
+
+    def load(self, threads: ty.Dict[ty.Tuple[str, str], ty.List[dict]]):
+        '''
+        Caches replies kept from an earlier session, e.g. MessageStore.replies(), oldest thread first.
+        '''
+        for key, replies in threads.items():
+            self.threads[key] = (replies[-1]['ts'], replies)
+            self.threads.move_to_end(key)
+            self.checked_at[key] = time.monotonic()
+        self.evict()
+
+    def note(self, ms: ty.Iterable[dict]):
+        oldest = time.time() - self.window
+        for m in ms:
+            latest = m.get('latest_reply')
+            if not latest:
+                continue
+            key = (m['channel'], m['ts'])
+            e = self.threads.get(key)
+            if e is None and float(latest) < oldest:
+                continue
+            if e is not None:
+                self.parents[key] = m
+            if e is None or e[0] != latest:
+                metrics.cache_miss('threads')
+                self.pending[key] = m
+            else:
+                metrics.cache_hit('threads')
+
+    def take(self) -> ty.List[dict]:
+        '''
+        The parents whose thread has to be fetched in this poll cycle, at most fetch_max.
+        They stay pending until put() or drop().
+        '''
+        now, mono = time.time(), time.monotonic()
+        while self.checks and self.checks[0] <= mono - 60.:
+            self.checks.popleft()
+        budget = self.checks_per_minute - len(self.checks)
+        if budget > 0:
+            overdue = []
+            for key in self.parents:
+                age = now - float(key[1])
+                late = mono - self.checked_at.get(key, 0.) - self.interval * age / self.window
+                if age > self.window and late >= 0. and key not in self.pending:
+                    overdue.append((late, key))
+            overdue.sort(reverse=True)
+            for _, key in overdue[:budget]:
+                self.pending[key] = self.parents[key]
+                self.checks.append(mono)
+        return list(self.pending.values())[:self.fetch_max]
+
+    def put(self, parent, r) -> ty.List[dict]:
+        '''
+        Caches the replies in the conversations.replies response r and returns them.
+        parent gets the reply_count and latest_reply of r, which an old parent had no other way to.
+        '''
+        replies = []
+        for m in r.get('messages', []):
+            if m.get('type') != 'message':
+                continue
+            if m['ts'] == parent['ts']:
+                parent.update({k: m[k] for k in ('reply_count', 'latest_reply') if k in m})
+                continue
+            m['channel'] = parent['channel']
+            replies.append(m)
+        key = (parent['channel'], parent['ts'])
+        self.pending.pop(key, None)
+        self.threads[key] = (parent.get('latest_reply'), replies)
+        self.threads.move_to_end(key)
+        self.parents[key] = parent
+        self.checked_at[key] = time.monotonic()
+        self.evict()
+        return replies
+
+    def drop(self, parent, forget: bool):
+        '''
+        For a failed fetch: no longer pending, and with forget, e.g. the parent was deleted, not cached either.
+        '''
+        key = (parent['channel'], parent['ts'])
+        self.pending.pop(key, None)
+        if forget:
+            self.forget(key)
+        elif key in self.threads:
+            # tried again with the next move or check
+            self.checked_at[key] = time.monotonic()
+
+    def forget(self, key):
+        for d in (self.threads, self.parents, self.checked_at, self.pending):
+            d.pop(key, None)
+
+    def prune(self, oldest: float):
+        for key in [key for key in self.threads if float(key[1]) < oldest]:
+            self.forget(key)
+
+    def evict(self):
+        while len(self.threads) > self.size:
+            self.forget(next(iter(self.threads)))
+
+    def replies(self, ch, ts) -> ty.List[dict]:
+        e = self.threads.get((ch, ts))
+        if e is None:
+            return []
+        self.threads.move_to_end((ch, ts))
+        return e[1]
@@ -0,0 +1,96 @@
+import ssl
+import time
+import threading
+import http.client
+import typing as ty
+from urllib.parse import urlsplit
+from urllib.request import Request
+
+from slack_dashboard.config_util import env_int, env_float
+
+
+POOL_SIZE = env_int('SLACK_POOL_SIZE', 4)
+IDLE_TIMEOUT = env_float('SLACK_POOL_IDLE_TIMEOUT', 60.)
+
+# Raised when a kept-alive connection was closed by the server while idle
+STALE_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine, BrokenPipeError, ConnectionResetError)
+
+
+class ConnectionPool:
+    '''
+    Keeps HTTP(S) connections alive between Slack API calls, so a poll
+    or a burst of profile lookups doesn't pay a TCP and TLS handshake each time.
+    At most max_size connections exist; idle ones expire after idle_timeout seconds.
+    '''
+    def __init__(self, max_size=POOL_SIZE, idle_timeout=IDLE_TIMEOUT, ssl_context: ty.Optional[ssl.SSLContext] = None):
+        self.idle_timeout = idle_timeout
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self.slots = threading.BoundedSemaphore(max(max_size, 1))
+        self.lock = threading.Lock()
+        self.idle: ty.Dict[ty.Tuple[str, str, int], ty.List[ty.Tuple[http.client.HTTPConnection, float]]] = {}
+
+    def request(self, req: Request, timeout) -> ty.Dict[str, ty.Any]:
+        u = urlsplit(req.full_url)
+        key = (u.scheme, u.hostname, u.port or (443 if u.scheme == 'https' else 80))
+        path = u.path + ('?' + u.query if u.query else '')
+        headers = dict(req.header_items())
+
+        with self.slots:
+            conn, reused = self.checkout(key, timeout)
+            try:
+                try:
+                    resp, body = self.send(conn, req.get_method(), path, req.data, headers)
+                except STALE_ERRORS:
+                    if not reused:
+                        raise
+                    conn.close()
+                    conn, reused = self.connect(key, timeout), False
+                    resp, body = self.send(conn, req.get_method(), path, req.data, headers)
+            except BaseException:
+                conn.close()
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self.checkin(key, conn)
+
+        if resp.msg.get_content_type() != 'application/gzip':
+            body = body.decode(resp.msg.get_content_charset() or 'utf-8')
+        return {'status': resp.status, 'headers': resp.msg, 'body': body}
+
+    @staticmethod
+    def send(conn, method, path, data, headers):
+        conn.request(method, path, body=data, headers=headers)
+        resp = conn.getresponse()
+        return resp, resp.read()
+
+    def checkout(self, key, timeout) -> ty.Tuple[http.client.HTTPConnection, bool]:
+        now = time.monotonic()
+        with self.lock:
+            conns = self.idle.get(key, [])
+            while conns:
+                conn, last_used = conns.pop()
+                if now - last_used < self.idle_timeout:
+                    conn.timeout = timeout
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                    return conn, True
+                conn.close()
+        return self.connect(key, timeout), False
+
+    def checkin(self, key, conn):
+        with self.lock:
+            self.idle.setdefault(key, []).append((conn, time.monotonic()))
+
+    def connect(self, key, timeout) -> http.client.HTTPConnection:
+        scheme, host, port = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=timeout, context=self.ssl_context)
+        return http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def close(self):
+        with self.lock:
+            for conns in self.idle.values():
+                for conn, _ in conns:
+                    conn.close()
+            self.idle = {}
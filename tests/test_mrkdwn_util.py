@@ -0,0 +1,86 @@
+from slack_dashboard.mrkdwn_util import Formatter, references, format_key
+
+
+class Profiles:
+    '''
+    Names by (kind, id), recording the lookups.
+    '''
+    def __init__(self, names=None):
+        self.names = names or {}
+        self.looked_up = []
+
+    def name(self, kind, id):
+        self.looked_up.append((kind, id))
+        return self.names.get((kind, id), id)
+
+
+def fmt(text, names=None, ch_names=None):
+    return Formatter(Profiles(names), ch_names or {}).text({'channel': 'C0', 'ts': '1.0', 'text': text})
+
+
+def test_user_mention():
+    assert fmt('hi <@U1>!', {('user', 'U1'): 'Ann'}) == 'hi @Ann!'
+
+
+def test_channel_link_with_and_without_label():
+    assert fmt('see <#C1|general>') == 'see #general'
+    # an empty label is looked up
+    assert fmt('see <#C1|>', {('channel', 'C1'): 'random'}) == 'see #random'
+    assert fmt('see <#C1>', ch_names={'C1': 'watched'}) == 'see #watched'
+
+
+def test_subteam():
+    assert fmt('<!subteam^S1|@devs> ping') == '@devs ping'
+    assert fmt('<!subteam^S1> ping', {('subteam', 'S1'): 'ops'}) == '@ops ping'
+
+
+def test_special_mentions_and_date():
+    assert fmt('<!here> <!channel> <!everyone>') == '@here @channel @everyone'
+    assert fmt('due <!date^1392734382^{date_short}|Feb 18, 2014>') == 'due Feb 18, 2014'
+    assert fmt('<!date^1392734382^{date_short}>') == '<date^1392734382^{date_short}>'
+
+
+def test_links():
+    assert fmt('<https://example.com|the site>') == 'the site'
+    assert fmt('<https://example.com/?a=1&amp;b=2>') == 'https://example.com/?a=1&b=2'
+    assert fmt('<mailto:a@example.com|a&amp;b>') == 'a&b'
+
+
+def test_entities():
+    assert fmt('a &amp; b &lt;c&gt;') == 'a & b <c>'
+    assert fmt('smile &#x1F600; &#128512;') == 'smile \U0001F600 \U0001F600'
+
+
+def test_escaped_mention_is_text():
+    profiles = Profiles()
+    f = Formatter(profiles, {})
+    m = {'channel': 'C0', 'ts': '1.0', 'text': '&lt;@U1&gt;'}
+    assert f.text(m) == '<@U1>'
+    assert profiles.looked_up == []
+    assert list(references(m['text'])) == []
+
+
+def test_references():
+    text = '<@U1> <#C1> <#C2|named> <!subteam^S1> <!subteam^S2|@x> <!here> <https://x|y>'
+    assert list(references(text)) == [('user', 'U1'), ('channel', 'C1'), ('subteam', 'S1')]
+
+
+def test_page_keys_skip_watched_channels():
+    f = Formatter(Profiles(), {'C1': 'general'})
+    ms = [{'user': 'U1', 'text': '<#C1> <#C2> <@U2>'}, {'bot_id': 'B1', 'text': ''}]
+    assert f.page_keys(ms) == {('user', 'U1'), ('channel', 'C2'), ('user', 'U2'), ('bot', 'B1')}
+
+
+def test_text_cached_until_edited():
+    profiles = Profiles({('user', 'U1'): 'Ann'})
+    f = Formatter(profiles, {}, size=2)
+    m = {'channel': 'C0', 'ts': '1.0', 'text': '<@U1>'}
+    assert f.text(m) == '@Ann'
+    assert f.text(dict(m)) == '@Ann'
+    assert len(profiles.looked_up) == 1
+    edited = dict(m, text='<@U1> again', edited={'ts': '2.0'})
+    assert f.text(edited) == '@Ann again'
+    assert format_key(edited) == ('C0', '1.0', '2.0')
+    # bounded
+    f.text({'channel': 'C0', 'ts': '3.0', 'text': 'x'})
+    assert len(f.cache) == 2
@@ -0,0 +1,72 @@
+import time
+
+from slack_dashboard.poll_util import Scheduler, BACKOFF_MAX, DEFAULT_RETRY_AFTER, TIER_PER_MINUTE, retry_after
+
+
+class Response:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+def test_poll_decays_when_quiet_and_resets_on_activity():
+    s = Scheduler(poll_min=2., poll_max=5.)
+    s.on_poll(0, 'C1')
+    assert s.intervals['C1'] == 3.
+    s.on_poll(0, 'C1')
+    assert s.intervals['C1'] == 4.5
+    s.on_poll(0, 'C1')
+    assert s.intervals['C1'] == 5.
+    s.on_poll(3, 'C1')
+    assert s.intervals['C1'] == 2.
+
+
+def test_due_keys_per_channel():
+    s = Scheduler(poll_min=2., poll_max=5.)
+    assert s.due_keys(['C1', 'C2']) == ['C1', 'C2']
+    s.on_poll(0, 'C1')
+    assert s.due_keys(['C1', 'C2']) == ['C2']
+    assert 0. < s.next_delay() <= 3.
+
+
+def test_retry_after():
+    s = Scheduler()
+    s.on_rate_limited('users.info', 10.)
+    assert 9. < s.delay_for('users.info') <= 10.
+    assert s.delay_for('conversations.history') == 0.
+    s.on_rate_limited('bots.info', None)
+    assert s.delay_for('bots.info') > DEFAULT_RETRY_AFTER - 1.
+    assert s.status().startswith('Rate limited')
+
+
+def test_retry_after_header():
+    assert retry_after(Response({'Retry-After': '3'})) == 3.
+    assert retry_after(Response({'retry-after': ['7']})) == 7.
+    assert retry_after(Response({})) is None
+    assert retry_after(Response(None)) is None
+
+
+def test_tier_window():
+    s = Scheduler()
+    for _ in range(TIER_PER_MINUTE[2]):
+        assert s.delay_for('users.list') == 0.
+        s.note_call('users.list')
+    assert 59. < s.delay_for('users.list') <= 60.
+    # calls older than a minute no longer count
+    s.calls['users.list'][0] -= 60.
+    assert s.delay_for('users.list') == 0.
+    # methods without a tier are never delayed
+    s.note_call('chat.unknown')
+    assert s.delay_for('chat.unknown') == 0.
+
+
+def test_backoff_grows_capped_and_resets():
+    s = Scheduler()
+    first = s.on_network_error()
+    assert 2. <= first <= 4.
+    assert s.next_delay() == first
+    for _ in range(2000):
+        d = s.on_network_error()
+    assert BACKOFF_MAX / 2 <= d <= BACKOFF_MAX
+    s.on_poll(0, 'C1')
+    assert s.backoff == 0.
+    assert s.on_network_error() <= 4.
@@ -0,0 +1,103 @@
+import time
+import threading
+
+from slack_dashboard.profile_util import ProfileCache, UNKNOWN_USER
+
+
+class Client:
+    '''
+    Answers users.info / users.list like Slack, counting the calls.
+    '''
+    def __init__(self, delay=0.):
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def users_info(self, user):
+        with self.lock:
+            self.calls.append(('users.info', user))
+        time.sleep(self.delay)
+        return {'user': {'profile': {'real_name': 'Name ' + user}}}
+
+    def users_list(self, limit, cursor):
+        with self.lock:
+            self.calls.append(('users.list', cursor))
+        if not cursor:
+            return {'members': [{'id': 'U1', 'profile': {'real_name': 'One'}}],
+                    'response_metadata': {'next_cursor': 'p2'}}
+        return {'members': [{'id': 'U2', 'name': 'two', 'profile': {'bot_id': 'B2'}}]}
+
+
+def cache(tmp_path, sc, ttl=60.):
+    return ProfileCache(sc, path=str(tmp_path / 'profile_cache.json'), ttl=ttl)
+
+
+def test_warm_reads_every_page(tmp_path):
+    sc = Client()
+    p = cache(tmp_path, sc)
+    p.warm()
+    assert [c[0] for c in sc.calls] == ['users.list', 'users.list']
+    assert p.name('user', 'U1') == 'One'
+    assert p.name('bot', 'B2') == 'two'
+    # within the TTL
+    p.warm()
+    assert len(sc.calls) == 2
+
+
+def test_entries_expire(tmp_path):
+    sc = Client()
+    p = cache(tmp_path, sc)
+    assert p.name('user', 'U9') == 'Name U9'
+    assert p.name('user', 'U9') == 'Name U9'
+    assert sc.calls == [('users.info', 'U9')]
+    p.entries['user:U9'] = ('Old', time.time() - 61.)
+    assert p.cached('user', 'U9') is None
+    assert p.name('user', 'U9') == 'Name U9'
+    assert len(sc.calls) == 2
+
+
+def test_expired_cache_warmed_again(tmp_path):
+    sc = Client()
+    p = cache(tmp_path, sc)
+    p.warm()
+    p.warmed_at -= 61.
+    p.warm()
+    assert len(sc.calls) == 4
+
+
+def test_saved_and_loaded(tmp_path):
+    p = cache(tmp_path, Client())
+    p.put('channel', 'C1', 'general')
+    p.save()
+    assert cache(tmp_path, None).cached('channel', 'C1') == 'general'
+
+
+def test_concurrent_misses_collapse(tmp_path):
+    sc = Client(delay=0.1)
+    p = cache(tmp_path, sc)
+    names = []
+    ts = [threading.Thread(target=lambda: names.append(p.name('user', 'U5'))) for _ in range(8)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    assert names == ['Name U5'] * 8
+    assert sc.calls == [('users.info', 'U5')]
+
+
+def test_refused_lookup_cached_as_unknown(tmp_path):
+    from slack_sdk.errors import SlackApiError
+    from slack_sdk.web import SlackResponse
+
+    class Refusing(Client):
+        def users_info(self, user):
+            self.calls.append(('users.info', user))
+            r = SlackResponse(client=None, http_verb='POST', api_url='', req_args={},
+                              data={'ok': False, 'error': 'user_not_found'}, headers={}, status_code=200)
+            raise SlackApiError('user_not_found', r)
+
+    sc = Refusing()
+    p = cache(tmp_path, sc)
+    assert p.name('user', 'U0') == UNKNOWN_USER
+    assert p.name('user', 'U0') == UNKNOWN_USER
+    assert len(sc.calls) == 1
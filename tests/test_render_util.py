@@ -0,0 +1,154 @@
+import time
+
+from slack_dashboard.render_util import MessageRecord, RenderModel, char_width, scroll_shift
+
+
+def rec(ts, ch='C1', un='alice', text='hi'):
+    return MessageRecord(ts, ch, ch.lower(), un, text)
+
+
+def model(*recs, scrollback=100):
+    m = RenderModel(scrollback)
+    m.set_width(80)
+    m.add_many(list(recs))
+    return m
+
+
+def texts(m):
+    return [''.join(s for s, _ in row) for row in m.visible_rows(100)]
+
+
+def test_add_many_appends_in_order():
+    now = time.time()
+    m = model(rec(now - 30), rec(now - 20))
+    m.add_many([rec(now - 10)])
+    assert [r.ts for r in m.records] == [now - 30, now - 20, now - 10]
+
+
+def test_add_many_merges_older_and_replaces_same_ts():
+    now = time.time()
+    m = model(rec(now - 30), rec(now - 10, text='old'))
+    m.add_many([rec(now - 20, un='bob'), rec(now - 10, text='new')])
+    assert [r.ts for r in m.records] == [now - 30, now - 20, now - 10]
+    assert m.records[-1].text == 'new'
+
+
+def test_add_many_same_ts_other_channel_kept():
+    now = time.time()
+    m = model(rec(now - 10, 'C1'))
+    m.add_many([rec(now - 10, 'C2')])
+    assert [r.ch for r in m.records] == ['C1', 'C2']
+
+
+def test_add_many_replaces_same_ts_between_other_channels():
+    now = time.time()
+    m = model(rec(now - 10, 'C1', text='old'), rec(now - 10, 'C2'))
+    m.add_many([rec(now - 10, 'C1', text='edited')])
+    assert [(r.ch, r.text) for r in m.records] == [('C1', 'edited'), ('C2', 'hi')]
+
+
+def test_add_many_relays_out_the_successor():
+    now = time.time()
+    m = model(rec(now - 30), rec(now - 10))
+    texts(m)
+    # the author header of the successor depends on the inserted message
+    m.add_many([rec(now - 20, un='bob')])
+    assert [t.split(' - ')[0].split('@')[-1] for t in texts(m)[1:]] == ['[alice]', '[bob]', '[alice]']
+
+
+def test_add_many_bounded_by_scrollback():
+    now = time.time()
+    m = model(*[rec(now - 100 + i) for i in range(5)], scrollback=3)
+    assert [r.ts for r in m.records] == [now - 98, now - 97, now - 96]
+    assert m.records[0].rows is None
+
+
+def test_add_many_keeps_the_scrolled_view():
+    now = time.time()
+    m = model(*[rec(now - 100 + i) for i in range(10)])
+    m.scroll = 2
+    m.add_many([rec(now - 50), rec(now - 40)])
+    assert m.scroll == 4
+
+
+def test_remove():
+    now = time.time()
+    m = model(rec(now - 30), rec(now - 20, un='bob'), rec(now - 10, un='bob'))
+    texts(m)
+    assert m.remove('C1', {now - 20})
+    assert [r.ts for r in m.records] == [now - 30, now - 10]
+    # bob is named again, now after alice
+    assert texts(m)[-1].split(' - ')[0].endswith('[bob]')
+
+
+def test_remove_other_channel_or_unknown_ts():
+    now = time.time()
+    m = model(rec(now - 20, 'C1'), rec(now - 10, 'C2'))
+    assert not m.remove('C2', {now - 20})
+    assert not m.remove('C1', {now - 5})
+    assert len(m.records) == 2
+
+
+def test_visible_rows_bottom_of_the_timeline():
+    now = time.time()
+    m = model(*[rec(now - 100 + i, text='m%d' % i) for i in range(10)])
+    rows = [''.join(s for s, _ in row) for row in m.visible_rows(3)]
+    assert [r.split(' - ')[-1] for r in rows] == ['m7', 'm8', 'm9']
+
+
+def test_visible_rows_scrolled_and_clamped():
+    now = time.time()
+    m = model(*[rec(now - 100 + i, text='m%d' % i) for i in range(10)])
+    m.scroll = 2
+    assert [''.join(s for s, _ in row).split(' - ')[-1] for row in m.visible_rows(3)] == ['m5', 'm6', 'm7']
+    # 10 messages and a date header: no further than the top
+    m.scroll = 100
+    m.visible_rows(3)
+    assert m.scroll == 8
+
+
+def test_visible_rows_lays_out_only_the_viewport():
+    now = time.time()
+    m = model(*[rec(now - 100 + i) for i in range(50)])
+    m.visible_rows(5)
+    # one row each, same author, same day
+    assert sum(r.rows is not None for r in m.records) == 5
+
+
+def test_layout_wraps_wide_characters():
+    m = model()
+    m.set_width(10)
+    r = rec(time.time(), text='あ' * 10)
+    rows = m.layout(r, r)
+    widths = [sum(char_width(c) for s, _ in row for c in s) for row in rows]
+    assert max(widths) <= 10 and len(rows) > 2
+    assert ''.join(s for row in rows for s, _ in row).endswith('あ' * 10)
+
+
+def test_set_width_invalidates():
+    now = time.time()
+    m = model(rec(now - 20), rec(now - 10))
+    m.visible_rows(10)
+    m.set_width(40)
+    assert all(r.rows is None for r in m.records)
+
+
+def test_prune():
+    now = time.time()
+    m = model(rec(now - 30), rec(now - 20), rec(now - 10))
+    m.visible_rows(10)
+    m.prune(now - 25)
+    assert [r.ts for r in m.records] == [now - 20, now - 10]
+    assert m.records[0].rows is None
+
+
+def test_scroll_shift():
+    a, b, c, d = [((s, 0),) for s in 'abcd']
+    assert scroll_shift([a, b, c], [b, c, d]) == 1
+    assert scroll_shift([a, b, c], [c, d]) == 2
+    # nothing to reuse
+    assert scroll_shift([a, b, c], [a, b, d]) == 0
+    assert scroll_shift([a, b, c], [d]) == 0
+    assert scroll_shift([], [a]) == 0
+    # b follows a on screen, but not in new
+    assert scroll_shift([a, b, c], [b, d]) == 0
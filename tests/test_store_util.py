@@ -0,0 +1,82 @@
+import time
+
+from slack_dashboard.store_util import MessageIndex, MessageStore
+
+
+def msg(ts, text='hi', **kwargs):
+    return dict({'type': 'message', 'channel': 'C1', 'ts': '%.6f' % ts, 'text': text}, **kwargs)
+
+
+def window():
+    now = time.time()
+    return MessageIndex(window=3600., interval=60.), now - 3600., now
+
+
+def test_diff_unchanged():
+    index, oldest, latest = window()
+    ms = [msg(latest - 20), msg(latest - 10)]
+    index.add(ms)
+    assert index.diff('C1', [dict(m) for m in ms], oldest, latest) == ([], [])
+
+
+def test_diff_edited_and_replied():
+    index, oldest, latest = window()
+    ms = [msg(latest - 30), msg(latest - 20), msg(latest - 10)]
+    index.add(ms)
+    edited = msg(latest - 30, 'fixed', edited={'ts': '%.6f' % latest})
+    replied = msg(latest - 20, latest_reply='%.6f' % latest)
+    changed, deleted = index.diff('C1', [edited, replied, dict(ms[2])], oldest, latest)
+    assert changed == [edited, replied]
+    assert deleted == []
+    # the index follows what was seen
+    assert index.diff('C1', [edited, replied, dict(ms[2])], oldest, latest) == ([], [])
+
+
+def test_diff_deleted_only_within_the_window():
+    index, oldest, latest = window()
+    ms = [msg(latest - 30), msg(latest - 20), msg(latest - 10)]
+    index.add(ms)
+    # ms[2] is newer than latest, e.g. arrived after the rescan started
+    changed, deleted = index.diff('C1', [ms[1]], oldest, latest - 15)
+    assert changed == []
+    assert deleted == [ms[0]['ts']]
+    changed, deleted = index.diff('C1', [ms[1]], oldest, latest)
+    assert deleted == [ms[2]['ts']]
+
+
+def test_diff_missed_message():
+    index, oldest, latest = window()
+    index.add([msg(latest - 20)])
+    missed = msg(latest - 10)
+    assert index.diff('C1', [msg(latest - 20), missed], oldest, latest) == ([missed], [])
+
+
+def test_diff_other_channel_untouched():
+    index, oldest, latest = window()
+    index.add([msg(latest - 20), dict(msg(latest - 10), channel='C2')])
+    assert index.diff('C1', [], oldest, latest) == ([], ['%.6f' % (latest - 20)])
+    assert index.diff('C2', [], oldest, latest) == ([], ['%.6f' % (latest - 10)])
+
+
+def test_due():
+    index = MessageIndex(window=3600., interval=0.)
+    assert not index.due('C1')
+    index.add([msg(time.time() - 10)])
+    assert index.due('C1')
+
+
+def test_replies_kept_and_deleted_with_the_parent(tmp_path):
+    store = MessageStore(str(tmp_path / 'messages.sqlite3'))
+    now = time.time()
+    p1, p2 = msg(now - 30), msg(now - 20)
+    store.put([p1, p2])
+    store.put_replies('C1', p1['ts'], [msg(now - 10, 'a'), msg(now - 5, 'b')])
+    store.put_replies('C1', p2['ts'], [msg(now - 8, 'c')])
+    store.put_replies('C1', p1['ts'], [msg(now - 10, 'a')])
+    threads = store.replies(['C1'], now - 60)
+    assert [[r['text'] for r in rs] for rs in threads.values()] == [['a'], ['c']]
+    store.delete('C1', [p1['ts']])
+    assert list(store.replies(['C1'], now - 60)) == [('C1', p2['ts'])]
+    store.prune(now - 15)
+    assert store.replies(['C1'], 0.) == {}
+    store.close()
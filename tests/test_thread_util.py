@@ -0,0 +1,106 @@
+import time
+
+from slack_dashboard.thread_util import ThreadCache
+
+
+def parent(age, latest_age=None, **kwargs):
+    m = {'type': 'message', 'channel': 'C1', 'ts': '%.6f' % (time.time() - age), 'text': 'hi'}
+    if latest_age is not None:
+        m['latest_reply'] = '%.6f' % (time.time() - latest_age)
+    m.update(kwargs)
+    return m
+
+
+def replies_of(m, *texts):
+    rs = [dict(m)] + [{'type': 'message', 'ts': m['latest_reply'], 'thread_ts': m['ts'], 'text': t} for t in texts]
+    return {'messages': rs}
+
+
+def test_note_queues_moved_threads_only():
+    cache = ThreadCache(window=3600., interval=60.)
+    m = parent(600, 60)
+    cache.note([m, parent(500)])
+    assert cache.take() == [m]
+    assert [r['text'] for r in cache.put(m, replies_of(m, 'a'))] == ['a']
+    assert cache.take() == []
+    cache.note([dict(m)])
+    assert cache.take() == []
+    cache.note([dict(m, latest_reply='%.6f' % time.time())])
+    assert len(cache.take()) == 1
+
+
+def test_unknown_old_threads_not_queued():
+    cache = ThreadCache(window=3600., interval=60.)
+    cache.note([parent(7200, 7000)])
+    assert cache.take() == []
+
+
+def test_old_cached_threads_checked_by_age():
+    cache = ThreadCache(window=3600., interval=60.)
+    m = parent(7200, 7000)
+    cache.load({('C1', m['ts']): [{'ts': m['latest_reply'], 'text': 'a'}]})
+    cache.note([m])
+    assert cache.take() == []
+    # checked every 60 * 2 seconds at two hours old
+    cache.checked_at[('C1', m['ts'])] -= 119.
+    assert cache.take() == []
+    cache.checked_at[('C1', m['ts'])] -= 2.
+    assert cache.take() == [m]
+
+
+def test_put_updates_the_parent():
+    cache = ThreadCache(window=3600., interval=60.)
+    m = parent(600, 60)
+    now = dict(m, reply_count=2, latest_reply='%.6f' % time.time())
+    cache.put(m, {'messages': [now]})
+    assert m['reply_count'] == 2 and m['latest_reply'] == now['latest_reply']
+
+
+def test_drop():
+    cache = ThreadCache(window=3600., interval=60.)
+    m = parent(600, 60)
+    cache.put(m, replies_of(m, 'a'))
+    cache.note([dict(m, latest_reply='%.6f' % time.time())])
+    cache.drop(m, forget=False)
+    assert cache.take() == []
+    assert len(cache.replies('C1', m['ts'])) == 1
+    cache.drop(m, forget=True)
+    assert cache.replies('C1', m['ts']) == []
+
+
+def test_evicts_least_recently_used():
+    cache = ThreadCache(size=2, window=3600., interval=60.)
+    ms = [parent(600 - i, 60) for i in range(3)]
+    cache.put(ms[0], replies_of(ms[0], 'a'))
+    cache.put(ms[1], replies_of(ms[1], 'b'))
+    cache.replies('C1', ms[0]['ts'])
+    cache.put(ms[2], replies_of(ms[2], 'c'))
+    assert cache.replies('C1', ms[1]['ts']) == []
+    assert len(cache.replies('C1', ms[0]['ts'])) == 1
+    assert set(cache.parents) == {('C1', ms[0]['ts']), ('C1', ms[2]['ts'])}
+
+
+def test_old_thread_checks_budgeted():
+    cache = ThreadCache(window=3600., interval=60., checks_per_minute=3)
+    ms = [parent(7200 + i * 60, 7000) for i in range(10)]
+    for m in ms:
+        cache.load({('C1', m['ts']): [{'ts': m['latest_reply'], 'text': 'a'}]})
+        cache.checked_at[('C1', m['ts'])] -= 1000.
+    cache.note(ms)
+    taken = cache.take()
+    # the most overdue: the younger parents, which are due more often
+    assert taken == ms[:3]
+    for m in taken:
+        cache.put(m, {'messages': []})
+    assert cache.take() == []
+    cache.checks = type(cache.checks)(t - 60. for t in cache.checks)
+    assert len(cache.take()) == 3
+
+
+def test_take_capped():
+    cache = ThreadCache(window=3600., interval=60., fetch_max=2)
+    ms = [parent(600 - i, 60) for i in range(5)]
+    cache.note(ms)
+    assert cache.take() == ms[:2]
+    cache.put(ms[0], {'messages': []})
+    assert cache.take() == ms[1:3]